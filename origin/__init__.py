@@ -29,3 +29,13 @@ VALIDATORS = dict()
 TILES = dict()
 
 COMMAND_SETS = dict()
+
+COMMAND_QUEUE = None
+
+COMMAND_DISPATCHER = None
+
+CONTENTS_INDEX = None
+
+PATHFINDER = None
+
+PASSWORD_HASHER = None
@@ -1,12 +1,20 @@
 class Tile:
     symbol = None
 
+    # Whether things may move onto this tile, and what it costs them to.
+    walkable = True
+    cost = 1.0
+
+    # Whether this tile blocks line of sight.
+    opaque = False
+
     def __str__(self):
         return self.__class__.__name__
 
 
 class Void(Tile):
     symbol = "V"
+    walkable = False
 
 
 class Road(Tile):
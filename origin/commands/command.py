@@ -42,6 +42,18 @@ class Command:
         """
         return getattr(cls, "__doc__", f"Help not implemented for {cls.name}, sorry.")
 
+    @classmethod
+    def prefixes(cls):
+        """
+        Yields every (prefix, key) pair which matches a key: each prefix of the
+        lowercased key at least its minimum length long, or at least one character
+        if it has none.
+        """
+        for k, v in cls.keys.items():
+            key = k.lower()
+            for length in range(max(v or 1, 1), len(key) + 1):
+                yield key[:length], k
+
     @classmethod
     async def match(cls, obj: "Object", text: str) -> str | None:
         """
@@ -54,13 +66,8 @@ class Command:
         lower = text.lower()
         for k, v in cls.keys.items():
             key = k.lower()
-            if isinstance(v, int):
-                minimum = key[:v]
-                if minimum.startswith(lower) and key.startswith(lower):
-                    return k
-            else:
-                if key.startswith(lower):
-                    return k
+            if len(lower) >= (v or 1) and key.startswith(lower):
+                return k
 
         return None
 
@@ -0,0 +1,82 @@
+import origin
+
+
+class CommandTable:
+    """
+    A compiled set of Commands, indexed by every prefix which may match one of them.
+
+    Each prefix of each key, from its minimum length up to the whole key, maps to the
+    (Command, key) candidates it matches, highest priority first. A lookup is then a
+    single dict access on the typed word instead of a scan of every Command's keys.
+    """
+
+    def __init__(self, commands: list["Command"]):
+        # Dedupe while keeping order, so equal priorities resolve consistently.
+        commands = sorted(dict.fromkeys(commands), key=lambda c: -c.priority)
+        self.commands = commands
+        self.prefixes: dict[str, list[tuple["Command", str]]] = dict()
+        for cmd in commands:
+            for prefix, key in cmd.prefixes():
+                candidates = self.prefixes.setdefault(prefix, list())
+                if not any(c is cmd for c, _ in candidates):
+                    candidates.append((cmd, key))
+
+    def __len__(self):
+        return len(self.commands)
+
+    def candidates(self, text: str) -> list[tuple["Command", str]]:
+        return self.prefixes.get(text.lower(), [])
+
+    async def match(self, obj: "Object", text: str) -> tuple["Command", str] | None:
+        """
+        Return the highest priority Command available to obj which matches text, and
+        the key it matched.
+        """
+        for cmd, key in self.candidates(text):
+            if await cmd.available(obj):
+                return cmd, key
+        return None
+
+
+class CommandDispatcher:
+    """
+    Caches a CommandTable per location command source and Object class.
+
+    A source is whatever Location.command_source() returns for the Location's
+    commands, and None when there are none. Tables are built from the Object's own
+    all_commands(), so subclasses which override it or get_basic_commands() are
+    respected; they must give every instance of the class the same commands for
+    the same source. Tables are rebuilt when the contents of origin.COMMAND_SETS
+    change; call invalidate() after changing a Command set or a source's commands
+    in place.
+    """
+
+    def __init__(self):
+        self.tables: dict = dict()
+        self.sets_signature = None
+
+    def invalidate(self, source=None):
+        """
+        Forget the tables for source, or every table if source is None.
+        """
+        if source is None:
+            self.tables.clear()
+        else:
+            for key in [key for key in self.tables if key[0] == source]:
+                del self.tables[key]
+
+    def check_command_sets(self):
+        signature = tuple(
+            (name, id(cmds), len(cmds)) for name, cmds in origin.COMMAND_SETS.items()
+        )
+        if signature != self.sets_signature:
+            self.sets_signature = signature
+            self.invalidate()
+
+    async def table(self, obj: "Object", location=None) -> CommandTable:
+        self.check_command_sets()
+        key = (location.command_source() if location else None, type(obj))
+        if (table := self.tables.get(key, None)) is None:
+            table = CommandTable(await obj.all_commands())
+            self.tables[key] = table
+        return table
@@ -0,0 +1,967 @@
+"""
+A small AQL interpreter used by the in-memory database backend.
+
+It understands the subset of AQL that origin itself issues: FOR/FILTER/LET/SORT/LIMIT/
+RETURN, subqueries, UPDATE/REPLACE/INSERT/REMOVE, bind parameters, and the handful of
+functions listed in FUNCTIONS. Queries are compiled into closures once and can then be
+executed any number of times against a store.
+"""
+
+import re
+import time
+import math
+
+from collections.abc import Callable
+
+
+class AQLError(ValueError):
+    def __init__(self, message: str, error_num: int = 1501):
+        super().__init__(message)
+        self.error_num = error_num
+
+
+KEYWORDS = {
+    "FOR",
+    "IN",
+    "FILTER",
+    "LET",
+    "RETURN",
+    "DISTINCT",
+    "SORT",
+    "ASC",
+    "DESC",
+    "LIMIT",
+    "UPDATE",
+    "REPLACE",
+    "WITH",
+    "INSERT",
+    "INTO",
+    "REMOVE",
+    "OPTIONS",
+    "AND",
+    "OR",
+    "NOT",
+    "LIKE",
+    "TRUE",
+    "FALSE",
+    "NULL",
+}
+
+TOKEN_RE = re.compile(
+    r"""
+    (?P<ws>\s+|//[^\n]*|/\*.*?\*/)
+    |(?P<number>\d+\.\d+(?:[eE][+-]?\d+)?|\d+(?:[eE][+-]?\d+)?)
+    |(?P<string>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')
+    |(?P<bind>@@?[A-Za-z0-9_]+)
+    |(?P<name>[A-Za-z_][A-Za-z0-9_]*|`[^`]+`)
+    |(?P<op>\.\.|==|!=|<=|>=|&&|\|\||[<>!+\-*/%?:.,()\[\]{}=])
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+
+ESCAPES = {"n": "\n", "r": "\r", "t": "\t", "\\": "\\", '"': '"', "'": "'", "/": "/"}
+
+
+def tokenize(text: str) -> list[tuple[str, object]]:
+    tokens = list()
+    pos = 0
+    while pos < len(text):
+        if not (match := TOKEN_RE.match(text, pos)):
+            raise AQLError(f"Syntax error near: {text[pos:pos + 20]!r}")
+        pos = match.end()
+        kind = match.lastgroup
+        value = match.group(kind)
+        match kind:
+            case "ws":
+                continue
+            case "number":
+                value = (
+                    float(value)
+                    if ("." in value or "e" in value.lower())
+                    else int(value)
+                )
+            case "string":
+                value = re.sub(
+                    r"\\(.)", lambda m: ESCAPES.get(m.group(1), m.group(1)), value[1:-1]
+                )
+            case "name":
+                if value.startswith("`"):
+                    value = value[1:-1]
+                elif value.upper() in KEYWORDS:
+                    kind = "keyword"
+                    value = value.upper()
+        tokens.append((kind, value))
+    tokens.append(("eof", None))
+    return tokens
+
+
+# Type ordering used by comparisons and SORT: null < bool < number < string < array < object.
+def type_rank(value) -> int:
+    if value is None:
+        return 0
+    if isinstance(value, bool):
+        return 1
+    if isinstance(value, (int, float)):
+        return 2
+    if isinstance(value, str):
+        return 3
+    if isinstance(value, list):
+        return 4
+    return 5
+
+
+def compare(a, b) -> int:
+    ra, rb = type_rank(a), type_rank(b)
+    if ra != rb:
+        return -1 if ra < rb else 1
+    match ra:
+        case 0:
+            return 0
+        case 4:
+            for x, y in zip(a, b):
+                if c := compare(x, y):
+                    return c
+            return (len(a) > len(b)) - (len(a) < len(b))
+        case 5:
+            ka, kb = sorted(a), sorted(b)
+            if c := compare(ka, kb):
+                return c
+            for k in ka:
+                if c := compare(a[k], b[k]):
+                    return c
+            return 0
+    return (a > b) - (a < b)
+
+
+def equals(a, b) -> bool:
+    return compare(a, b) == 0
+
+
+def truthy(value) -> bool:
+    if isinstance(value, (list, dict)):
+        return True
+    return bool(value)
+
+
+def to_number(value):
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        try:
+            return int(value) if value.strip().lstrip("-").isdigit() else float(value)
+        except ValueError:
+            return 0
+    if isinstance(value, list) and len(value) == 1:
+        return to_number(value[0])
+    return 0
+
+
+def to_string(value) -> str:
+    match value:
+        case None:
+            return ""
+        case bool():
+            return "true" if value else "false"
+        case str():
+            return value
+        case float() if value.is_integer():
+            return str(int(value))
+    return str(value)
+
+
+def get_attribute(value, name):
+    if isinstance(value, dict):
+        return value.get(name, None)
+    return None
+
+
+def get_index(value, index):
+    if isinstance(value, list):
+        if isinstance(index, bool) or not isinstance(index, (int, float)):
+            return None
+        index = int(index)
+        if -len(value) <= index < len(value):
+            return value[index]
+        return None
+    if isinstance(value, dict):
+        return value.get(to_string(index), None)
+    return None
+
+
+def like(value, pattern, case_insensitive=False) -> bool:
+    regex = ""
+    escaped = False
+    for char in to_string(pattern):
+        if escaped:
+            regex += re.escape(char)
+            escaped = False
+        elif char == "\\":
+            escaped = True
+        elif char == "%":
+            regex += ".*"
+        elif char == "_":
+            regex += "."
+        else:
+            regex += re.escape(char)
+    flags = re.DOTALL | (re.IGNORECASE if case_insensitive else 0)
+    return re.fullmatch(regex, to_string(value), flags) is not None
+
+
+class Context:
+    """
+    Runtime state for one query execution.
+    """
+
+    def __init__(self, store, bind_vars: dict):
+        self.store = store
+        self.bind_vars = bind_vars
+        self.writes = 0
+
+    def bind(self, name: str):
+        if name not in self.bind_vars:
+            raise AQLError(f"Bind parameter '{name}' was not declared", 1552)
+        return self.bind_vars[name]
+
+
+def fn_document(ctx, *args):
+    if len(args) == 2:
+        collection, keys = args
+        if isinstance(keys, list):
+            return [d for k in keys if (d := ctx.store.lookup(f"{collection}/{k}"))]
+        return ctx.store.lookup(f"{collection}/{keys}")
+    (ids,) = args
+    if isinstance(ids, list):
+        return [d for id in ids if (d := ctx.store.lookup(id)) is not None]
+    if isinstance(ids, dict):
+        ids = ids.get("_id", None)
+    if not isinstance(ids, str):
+        return None
+    return ctx.store.lookup(ids)
+
+
+def fn_length(ctx, value):
+    if isinstance(value, (list, dict, str)):
+        return len(value)
+    if value is None:
+        return 0
+    if isinstance(value, bool):
+        return int(value)
+    return len(to_string(value))
+
+
+def fn_keep(ctx, doc, *names):
+    if not isinstance(doc, dict):
+        return None
+    keys = set()
+    for name in names:
+        keys.update(name if isinstance(name, list) else [name])
+    return {k: v for k, v in doc.items() if k in keys}
+
+
+def fn_unset(ctx, doc, *names):
+    if not isinstance(doc, dict):
+        return None
+    keys = set()
+    for name in names:
+        keys.update(name if isinstance(name, list) else [name])
+    return {k: v for k, v in doc.items() if k not in keys}
+
+
+def fn_merge(ctx, *docs):
+    if len(docs) == 1 and isinstance(docs[0], list):
+        docs = docs[0]
+    out = dict()
+    for doc in docs:
+        if isinstance(doc, dict):
+            out.update(doc)
+    return out
+
+
+def fn_attributes(ctx, doc, remove_system=False, sort=False):
+    if not isinstance(doc, dict):
+        return None
+    out = [k for k in doc if not (remove_system and k.startswith("_"))]
+    return sorted(out) if sort else out
+
+
+def fn_flatten(ctx, value, depth=1):
+    if not isinstance(value, list):
+        return None
+    out = list()
+    for item in value:
+        if isinstance(item, list) and depth > 0:
+            out.extend(fn_flatten(ctx, item, depth - 1))
+        else:
+            out.append(item)
+    return out
+
+
+def fn_unique(ctx, value):
+    if not isinstance(value, list):
+        return None
+    out = list()
+    for item in value:
+        if not any(equals(item, o) for o in out):
+            out.append(item)
+    return out
+
+
+def fn_position(ctx, value, search, return_index=False):
+    if not isinstance(value, list):
+        return -1 if return_index else False
+    for i, item in enumerate(value):
+        if equals(item, search):
+            return i if return_index else True
+    return -1 if return_index else False
+
+
+def fn_substring(ctx, value, offset, length=None):
+    value = to_string(value)
+    offset = int(to_number(offset))
+    if length is None:
+        return value[offset:]
+    return value[offset : offset + int(to_number(length))]
+
+
+def fn_numbers(func):
+    def inner(ctx, value):
+        if not isinstance(value, list):
+            return None
+        numbers = [to_number(v) for v in value if v is not None]
+        return func(numbers) if numbers else None
+
+    return inner
+
+
+FUNCTIONS: dict[str, Callable] = {
+    "DOCUMENT": fn_document,
+    "LOWER": lambda ctx, v: to_string(v).lower(),
+    "UPPER": lambda ctx, v: to_string(v).upper(),
+    "TRIM": lambda ctx, v: to_string(v).strip(),
+    "CONCAT": lambda ctx, *v: "".join(to_string(x) for x in v),
+    "TO_STRING": lambda ctx, v: to_string(v),
+    "TO_NUMBER": lambda ctx, v: to_number(v),
+    "TO_BOOL": lambda ctx, v: truthy(v),
+    "SUBSTRING": fn_substring,
+    "STARTS_WITH": lambda ctx, v, prefix: to_string(v).startswith(to_string(prefix)),
+    "CONTAINS": lambda ctx, v, s: to_string(s) in to_string(v),
+    "LIKE": lambda ctx, v, p, ci=False: like(v, p, ci),
+    "SPLIT": lambda ctx, v, sep=None: to_string(v).split(sep),
+    "COUNT": fn_length,
+    "LENGTH": fn_length,
+    "FIRST": lambda ctx, v: v[0] if isinstance(v, list) and v else None,
+    "LAST": lambda ctx, v: v[-1] if isinstance(v, list) and v else None,
+    "NTH": lambda ctx, v, i: get_index(v, i),
+    "SHIFT": lambda ctx, v: v[1:] if isinstance(v, list) else None,
+    "POP": lambda ctx, v: v[:-1] if isinstance(v, list) else None,
+    "PUSH": lambda ctx, v, x, unique=False: (
+        ((v + [x]) if not (unique and fn_position(ctx, v, x)) else list(v))
+        if isinstance(v, list)
+        else None
+    ),
+    "APPEND": lambda ctx, v, x, unique=False: (
+        (
+            fn_unique(ctx, v + (x if isinstance(x, list) else [x]))
+            if unique
+            else v + (x if isinstance(x, list) else [x])
+        )
+        if isinstance(v, list)
+        else None
+    ),
+    "SLICE": lambda ctx, v, start, length=None: (
+        v[int(start) : (None if length is None else int(start) + int(length))]
+        if isinstance(v, list)
+        else None
+    ),
+    "REVERSE": lambda ctx, v: v[::-1] if isinstance(v, (list, str)) else None,
+    "FLATTEN": fn_flatten,
+    "UNIQUE": fn_unique,
+    "POSITION": fn_position,
+    "CONTAINS_ARRAY": fn_position,
+    "SORTED": lambda ctx, v: sorted(v, key=SortKey) if isinstance(v, list) else None,
+    "MIN": fn_numbers(min),
+    "MAX": fn_numbers(max),
+    "SUM": lambda ctx, v: sum(to_number(x) for x in v) if isinstance(v, list) else None,
+    "ABS": lambda ctx, v: abs(to_number(v)),
+    "FLOOR": lambda ctx, v: math.floor(to_number(v)),
+    "CEIL": lambda ctx, v: math.ceil(to_number(v)),
+    "ROUND": lambda ctx, v: math.floor(to_number(v) + 0.5),
+    "KEEP": fn_keep,
+    "UNSET": fn_unset,
+    "MERGE": fn_merge,
+    "ATTRIBUTES": fn_attributes,
+    "HAS": lambda ctx, doc, name: isinstance(doc, dict) and name in doc,
+    "VALUES": lambda ctx, doc, rs=False: (
+        [v for k, v in doc.items() if not (rs and k.startswith("_"))]
+        if isinstance(doc, dict)
+        else None
+    ),
+    "NOT_NULL": lambda ctx, *v: next((x for x in v if x is not None), None),
+    "IS_NULL": lambda ctx, v: v is None,
+    "IS_STRING": lambda ctx, v: isinstance(v, str),
+    "IS_NUMBER": lambda ctx, v: isinstance(v, (int, float)) and not isinstance(v, bool),
+    "IS_ARRAY": lambda ctx, v: isinstance(v, list),
+    "IS_LIST": lambda ctx, v: isinstance(v, list),
+    "IS_OBJECT": lambda ctx, v: isinstance(v, dict),
+    "IS_DOCUMENT": lambda ctx, v: isinstance(v, dict),
+    "IS_BOOL": lambda ctx, v: isinstance(v, bool),
+    "DATE_NOW": lambda ctx: int(time.time() * 1000),
+    "RANGE": lambda ctx, start, stop, step=1: list(
+        range(int(start), int(stop) + (1 if step > 0 else -1), int(step))
+    ),
+}
+
+
+class SortKey:
+    __slots__ = ["value"]
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return compare(self.value, other.value) < 0
+
+    def __eq__(self, other):
+        return compare(self.value, other.value) == 0
+
+
+def arithmetic(op: str, a, b):
+    a, b = to_number(a), to_number(b)
+    match op:
+        case "+":
+            return a + b
+        case "-":
+            return a - b
+        case "*":
+            return a * b
+        case "/":
+            return a / b if b else None
+        case "%":
+            return a % b if b else None
+
+
+class Parser:
+    """
+    Compiles AQL source into a list of operations whose expressions are closures of
+    the form fn(ctx, scope) -> value.
+    """
+
+    def __init__(self, text: str):
+        self.tokens = tokenize(text)
+        self.pos = 0
+        # IN is both an operator and part of UPDATE ... IN collection. While parsing
+        # the operands of a modification, a bare IN ends the expression.
+        self.allow_in = True
+
+    # Token helpers
+    def peek(self, offset: int = 0):
+        return self.tokens[min(self.pos + offset, len(self.tokens) - 1)]
+
+    def next(self):
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def at(self, kind: str, value=None, offset: int = 0) -> bool:
+        k, v = self.peek(offset)
+        return k == kind and (value is None or v == value)
+
+    def accept(self, kind: str, value=None):
+        if self.at(kind, value):
+            return self.next()
+        return None
+
+    def expect(self, kind: str, value=None):
+        if not (token := self.accept(kind, value)):
+            raise AQLError(
+                f"Syntax error: expected {value or kind}, got {self.peek()[1]!r}"
+            )
+        return token
+
+    def keyword(self, value: str) -> bool:
+        return self.accept("keyword", value) is not None
+
+    # Statements
+    def parse(self) -> list:
+        ops = self.parse_body()
+        self.expect("eof")
+        return ops
+
+    def parse_body(self) -> list:
+        ops = list()
+        while True:
+            kind, value = self.peek()
+            if kind != "keyword":
+                break
+            match value:
+                case "FOR":
+                    self.next()
+                    var = self.expect("name")[1]
+                    self.expect("keyword", "IN")
+                    ops.append(("for", var, self.parse_expression()))
+                case "FILTER":
+                    self.next()
+                    ops.append(("filter", self.parse_expression()))
+                case "LET":
+                    self.next()
+                    var = self.expect("name")[1]
+                    self.expect("op", "=")
+                    ops.append(("let", var, self.parse_expression()))
+                case "SORT":
+                    self.next()
+                    criteria = list()
+                    while True:
+                        expr = self.parse_expression()
+                        ascending = True
+                        if self.keyword("DESC"):
+                            ascending = False
+                        else:
+                            self.keyword("ASC")
+                        criteria.append((expr, ascending))
+                        if not self.accept("op", ","):
+                            break
+                    ops.append(("sort", criteria))
+                case "LIMIT":
+                    self.next()
+                    first = self.parse_expression()
+                    if self.accept("op", ","):
+                        ops.append(("limit", first, self.parse_expression()))
+                    else:
+                        ops.append(("limit", constant(0), first))
+                case "UPDATE" | "REPLACE":
+                    self.next()
+                    target = self.parse_operand()
+                    data = None
+                    if self.keyword("WITH"):
+                        data = self.parse_operand()
+                    self.expect("keyword", "IN")
+                    collection = self.parse_collection()
+                    options = self.parse_options()
+                    ops.append((value.lower(), target, data, collection, options))
+                case "INSERT":
+                    self.next()
+                    data = self.parse_operand()
+                    if not self.keyword("INTO"):
+                        self.expect("keyword", "IN")
+                    collection = self.parse_collection()
+                    options = self.parse_options()
+                    ops.append(("insert", data, collection, options))
+                case "REMOVE":
+                    self.next()
+                    target = self.parse_operand()
+                    self.expect("keyword", "IN")
+                    collection = self.parse_collection()
+                    options = self.parse_options()
+                    ops.append(("remove", target, collection, options))
+                case "RETURN":
+                    self.next()
+                    distinct = self.keyword("DISTINCT")
+                    ops.append(("return", self.parse_expression(), distinct))
+                    return ops
+                case _:
+                    break
+        return ops
+
+    def parse_collection(self):
+        kind, value = self.next()
+        if kind == "name":
+            return lambda ctx, scope: value
+        if kind == "bind" and value.startswith("@@"):
+            name = value[2:]
+            return lambda ctx, scope: ctx.bind(f"@{name}")
+        raise AQLError(f"Syntax error: expected collection name, got {value!r}")
+
+    def parse_options(self):
+        if self.keyword("OPTIONS"):
+            return self.parse_expression()
+        return constant(dict())
+
+    # Expressions, from lowest to highest precedence.
+    def parse_operand(self):
+        allow_in, self.allow_in = self.allow_in, False
+        try:
+            return self.parse_expression(nested=False)
+        finally:
+            self.allow_in = allow_in
+
+    def parse_expression(self, nested=True):
+        if nested:
+            allow_in, self.allow_in = self.allow_in, True
+            try:
+                return self.parse_expression(nested=False)
+            finally:
+                self.allow_in = allow_in
+        condition = self.parse_or()
+        if self.accept("op", "?"):
+            if self.accept("op", ":"):
+                otherwise = self.parse_expression()
+                return lambda ctx, scope: (
+                    value
+                    if truthy(value := condition(ctx, scope))
+                    else otherwise(ctx, scope)
+                )
+            then = self.parse_expression()
+            self.expect("op", ":")
+            otherwise = self.parse_expression()
+            return lambda ctx, scope: (
+                then(ctx, scope)
+                if truthy(condition(ctx, scope))
+                else otherwise(ctx, scope)
+            )
+        return condition
+
+    def parse_or(self):
+        left = self.parse_and()
+        while self.accept("op", "||") or self.keyword("OR"):
+            right = self.parse_and()
+            left = (
+                lambda l, r: lambda ctx, scope: (
+                    value if truthy(value := l(ctx, scope)) else r(ctx, scope)
+                )
+            )(left, right)
+        return left
+
+    def parse_and(self):
+        left = self.parse_not()
+        while self.accept("op", "&&") or self.keyword("AND"):
+            right = self.parse_not()
+            left = (
+                lambda l, r: lambda ctx, scope: (
+                    r(ctx, scope) if truthy(value := l(ctx, scope)) else value
+                )
+            )(left, right)
+        return left
+
+    def parse_not(self):
+        if self.accept("op", "!") or (
+            self.at("keyword", "NOT") and not self.at("keyword", "IN", 1)
+        ):
+            if self.at("keyword", "NOT"):
+                self.next()
+            operand = self.parse_not()
+            return lambda ctx, scope: not truthy(operand(ctx, scope))
+        return self.parse_comparison()
+
+    def parse_comparison(self):
+        left = self.parse_range()
+        while True:
+            kind, value = self.peek()
+            negate = False
+            if kind == "op" and value in ("==", "!=", "<", "<=", ">", ">="):
+                self.next()
+                op = value
+            elif kind == "keyword" and (
+                value == "LIKE" or (value == "IN" and self.allow_in)
+            ):
+                self.next()
+                op = value
+            elif (
+                kind == "keyword"
+                and value == "NOT"
+                and (
+                    (self.allow_in and self.at("keyword", "IN", 1))
+                    or self.at("keyword", "LIKE", 1)
+                )
+            ):
+                self.next()
+                op = self.next()[1]
+                negate = True
+            else:
+                return left
+            right = self.parse_range()
+            left = self.make_comparison(op, negate, left, right)
+
+    @staticmethod
+    def make_comparison(op, negate, left, right):
+        match op:
+            case "==":
+                test = equals
+            case "!=":
+                test = lambda a, b: not equals(a, b)
+            case "<":
+                test = lambda a, b: compare(a, b) < 0
+            case "<=":
+                test = lambda a, b: compare(a, b) <= 0
+            case ">":
+                test = lambda a, b: compare(a, b) > 0
+            case ">=":
+                test = lambda a, b: compare(a, b) >= 0
+            case "IN":
+                test = lambda a, b: isinstance(b, list) and any(equals(a, x) for x in b)
+            case "LIKE":
+                test = like
+        if negate:
+            return lambda ctx, scope: not test(left(ctx, scope), right(ctx, scope))
+        return lambda ctx, scope: test(left(ctx, scope), right(ctx, scope))
+
+    def parse_range(self):
+        left = self.parse_additive()
+        if self.accept("op", ".."):
+            right = self.parse_additive()
+            return lambda ctx, scope: list(
+                range(
+                    int(to_number(left(ctx, scope))),
+                    int(to_number(right(ctx, scope))) + 1,
+                )
+            )
+        return left
+
+    def parse_additive(self):
+        left = self.parse_multiplicative()
+        while self.at("op", "+") or self.at("op", "-"):
+            op = self.next()[1]
+            right = self.parse_multiplicative()
+            left = (
+                lambda o, l, r: lambda ctx, scope: arithmetic(
+                    o, l(ctx, scope), r(ctx, scope)
+                )
+            )(op, left, right)
+        return left
+
+    def parse_multiplicative(self):
+        left = self.parse_unary()
+        while self.at("op", "*") or self.at("op", "/") or self.at("op", "%"):
+            op = self.next()[1]
+            right = self.parse_unary()
+            left = (
+                lambda o, l, r: lambda ctx, scope: arithmetic(
+                    o, l(ctx, scope), r(ctx, scope)
+                )
+            )(op, left, right)
+        return left
+
+    def parse_unary(self):
+        if self.accept("op", "-"):
+            operand = self.parse_unary()
+            return lambda ctx, scope: -to_number(operand(ctx, scope))
+        if self.accept("op", "+"):
+            operand = self.parse_unary()
+            return lambda ctx, scope: to_number(operand(ctx, scope))
+        return self.parse_postfix()
+
+    def parse_postfix(self):
+        expr = self.parse_primary()
+        while True:
+            if self.accept("op", "."):
+                kind, value = self.next()
+                if kind in ("name", "keyword"):
+                    expr = (
+                        lambda e, n: lambda ctx, scope: get_attribute(e(ctx, scope), n)
+                    )(expr, value)
+                elif kind == "bind":
+                    expr = (
+                        lambda e, n: lambda ctx, scope: get_attribute(
+                            e(ctx, scope), ctx.bind(n)
+                        )
+                    )(expr, value[1:])
+                else:
+                    raise AQLError(f"Syntax error: bad attribute name {value!r}")
+            elif self.accept("op", "["):
+                index = self.parse_expression()
+                self.expect("op", "]")
+                expr = (
+                    lambda e, i: lambda ctx, scope: get_index(
+                        e(ctx, scope), i(ctx, scope)
+                    )
+                )(expr, index)
+            else:
+                return expr
+
+    def parse_primary(self):
+        kind, value = self.next()
+        match kind:
+            case "number" | "string":
+                return constant(value)
+            case "bind":
+                if value.startswith("@@"):
+                    name = f"@{value[2:]}"
+                    return lambda ctx, scope: ctx.store.scan(ctx.bind(name))
+                name = value[1:]
+                return lambda ctx, scope: ctx.bind(name)
+            case "keyword":
+                match value:
+                    case "TRUE":
+                        return constant(True)
+                    case "FALSE":
+                        return constant(False)
+                    case "NULL":
+                        return constant(None)
+                raise AQLError(f"Syntax error: unexpected keyword {value}")
+            case "name":
+                if self.at("op", "("):
+                    return self.parse_call(value)
+                return self.make_name(value)
+            case "op":
+                match value:
+                    case "(":
+                        if self.at("keyword", "FOR") or self.at("keyword", "LET"):
+                            body = self.parse_body()
+                            self.expect("op", ")")
+                            return lambda ctx, scope: execute(body, ctx, scope)
+                        expr = self.parse_expression()
+                        self.expect("op", ")")
+                        return expr
+                    case "[":
+                        items = list()
+                        while not self.accept("op", "]"):
+                            items.append(self.parse_expression())
+                            if not self.accept("op", ","):
+                                self.expect("op", "]")
+                                break
+                        return lambda ctx, scope: [i(ctx, scope) for i in items]
+                    case "{":
+                        return self.parse_object()
+        raise AQLError(f"Syntax error: unexpected {value!r}")
+
+    @staticmethod
+    def make_name(name: str):
+        def lookup(ctx, scope):
+            if name in scope:
+                return scope[name]
+            return ctx.store.scan(name)
+
+        return lookup
+
+    def parse_call(self, name: str):
+        self.expect("op", "(")
+        args = list()
+        while not self.accept("op", ")"):
+            args.append(self.parse_expression())
+            if not self.accept("op", ","):
+                self.expect("op", ")")
+                break
+        if not (func := FUNCTIONS.get(name.upper(), None)):
+            raise AQLError(f"Usage of unknown function '{name}()'", 1540)
+        return lambda ctx, scope: func(ctx, *[a(ctx, scope) for a in args])
+
+    def parse_object(self):
+        entries = list()
+        while not self.accept("op", "}"):
+            kind, value = self.next()
+            if kind in ("name", "keyword", "string", "number"):
+                key = constant(to_string(value))
+                if not self.at("op", ":"):
+                    # Shorthand {doc} is {doc: doc}.
+                    entries.append((key, self.make_name(value)))
+                    if not self.accept("op", ","):
+                        self.expect("op", "}")
+                        break
+                    continue
+            elif kind == "bind":
+                key = (lambda n: lambda ctx, scope: ctx.bind(n))(value[1:])
+            elif kind == "op" and value == "[":
+                key = self.parse_expression()
+                self.expect("op", "]")
+            else:
+                raise AQLError(f"Syntax error: bad object key {value!r}")
+            self.expect("op", ":")
+            entries.append((key, self.parse_expression()))
+            if not self.accept("op", ","):
+                self.expect("op", "}")
+                break
+        return lambda ctx, scope: {
+            to_string(k(ctx, scope)): v(ctx, scope) for k, v in entries
+        }
+
+
+def constant(value):
+    return lambda ctx, scope: value
+
+
+def execute(ops: list, ctx: Context, scope: dict) -> list:
+    """
+    Run compiled operations, starting from a single row. Returns the RETURN results,
+    or an empty list for queries that only modify data.
+    """
+    rows = [dict(scope)]
+    for op in ops:
+        match op[0]:
+            case "for":
+                _, var, source = op
+                out = list()
+                for row in rows:
+                    items = source(ctx, row)
+                    if isinstance(items, dict):
+                        items = [items]
+                    elif not isinstance(items, list):
+                        items = []
+                    for item in items:
+                        new_row = dict(row)
+                        new_row[var] = item
+                        out.append(new_row)
+                rows = out
+            case "filter":
+                expr = op[1]
+                rows = [row for row in rows if truthy(expr(ctx, row))]
+            case "let":
+                _, var, expr = op
+                for row in rows:
+                    row[var] = expr(ctx, row)
+            case "sort":
+                for expr, ascending in reversed(op[1]):
+                    rows.sort(
+                        key=lambda row: SortKey(expr(ctx, row)), reverse=not ascending
+                    )
+            case "limit":
+                _, offset, count = op
+                offset = int(to_number(offset(ctx, scope)))
+                count = int(to_number(count(ctx, scope)))
+                rows = rows[offset : offset + count]
+            case "update" | "replace":
+                _, target, data, collection, options = op
+                out = list()
+                for row in rows:
+                    opts = options(ctx, row) or dict()
+                    found = ctx.store.modify(
+                        op[0],
+                        collection(ctx, row),
+                        target(ctx, row),
+                        data(ctx, row) if data else None,
+                        opts,
+                    )
+                    if found is None:
+                        continue
+                    ctx.writes += 1
+                    row["OLD"], row["NEW"] = found
+                    out.append(row)
+                rows = out
+            case "insert":
+                _, data, collection, options = op
+                for row in rows:
+                    row["NEW"] = ctx.store.insert(collection(ctx, row), data(ctx, row))
+                    row["OLD"] = None
+                    ctx.writes += 1
+            case "remove":
+                _, target, collection, options = op
+                out = list()
+                for row in rows:
+                    opts = options(ctx, row) or dict()
+                    if (
+                        old := ctx.store.remove(
+                            collection(ctx, row), target(ctx, row), opts
+                        )
+                    ) is None:
+                        continue
+                    ctx.writes += 1
+                    row["OLD"] = old
+                    out.append(row)
+                rows = out
+            case "return":
+                _, expr, distinct = op
+                results = [expr(ctx, row) for row in rows]
+                if distinct:
+                    results = fn_unique(ctx, results)
+                return results
+    return []
+
+
+class Query:
+    def __init__(self, text: str):
+        self.text = text
+        self.ops = Parser(text).parse()
+
+    def execute(self, store, bind_vars: dict | None = None) -> tuple[list, int]:
+        ctx = Context(store, bind_vars or dict())
+        return execute(self.ops, ctx, dict()), ctx.writes
@@ -1,8 +1,66 @@
 import httpx
 import asyncio
 import origin
+import orjson
 import jwt
 import time
+import itertools
+import logging
+from collections import OrderedDict
+
+
+def merge_patch(target: dict, patch: dict) -> dict:
+    """
+    Apply a PATCH to target in place the way ArangoDB does with keepNull=false and
+    mergeObjects=true: nested objects are merged and None removes an attribute.
+    """
+    for k, v in patch.items():
+        if v is None:
+            target.pop(k, None)
+        elif isinstance(v, dict):
+            if not isinstance(existing := target.get(k, None), dict):
+                existing = target[k] = dict()
+            merge_patch(existing, v)
+        else:
+            target[k] = v
+    return target
+
+
+def combine_patches(first: dict, second: dict) -> dict:
+    """
+    Fold the PATCH second into first in place, so that applying first afterwards
+    has the same effect as applying both in order. None is kept as a removal marker.
+    """
+    for k, v in second.items():
+        if isinstance(v, dict) and isinstance(existing := first.get(k, None), dict):
+            combine_patches(existing, v)
+        else:
+            first[k] = v
+    return first
+
+
+def contains_none(data: dict) -> bool:
+    """
+    Whether data has a None value at any depth.
+    """
+    return any(
+        v is None or (isinstance(v, dict) and contains_none(v)) for v in data.values()
+    )
+
+
+def patches_conflict(first: dict, second: dict) -> bool:
+    """
+    Whether the PATCH second sets an object over an attribute which first sets to
+    anything else, including removing it. Applied in order, that object replaces
+    the attribute outright, but a combined patch would merge it into whatever the
+    attribute held before first.
+    """
+    for k, v in second.items():
+        if not isinstance(v, dict) or k not in first:
+            continue
+        if not isinstance(existing := first[k], dict) or patches_conflict(existing, v):
+            return True
+    return False
 
 
 class Cursor:
@@ -40,15 +98,102 @@ class Cursor:
         await self.dbmanager.delete(f"/_api/cursor/{self.id}")
 
 
+class DocumentCache:
+    """
+    An in-process identity map of Document ID -> Document, evicted in least-recently-used
+    order once it holds more than max_size documents.
+
+    Documents are kept serialized, so every get() hands out a fresh copy that callers are
+    free to mutate without corrupting the cache.
+    """
+
+    def __init__(self, max_size: int = 10000):
+        self.max_size = max_size
+        self.documents: OrderedDict[str, tuple[str | None, bytes]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.documents)
+
+    def __contains__(self, id: str):
+        return id in self.documents
+
+    def get(self, id: str) -> dict | None:
+        if (found := self.documents.get(id, None)) is None:
+            self.misses += 1
+            return None
+        self.documents.move_to_end(id)
+        self.hits += 1
+        return orjson.loads(found[1])
+
+    def revision(self, id: str) -> str | None:
+        if found := self.documents.get(id, None):
+            return found[0]
+        return None
+
+    def store(self, doc: dict, force: bool = False):
+        """
+        Store a full document. If the cached copy already has the same _rev, it is only
+        marked as recently used unless force is True.
+        """
+        if self.max_size <= 0 or not doc or not (id := doc.get("_id", None)):
+            return
+        rev = doc.get("_rev", None)
+        found = self.documents.get(id, None)
+        if force or not (found and rev is not None and found[0] == rev):
+            self.documents[id] = (rev, orjson.dumps(doc))
+        self.documents.move_to_end(id)
+        while len(self.documents) > self.max_size:
+            self.documents.popitem(last=False)
+            self.evictions += 1
+
+    def discard(self, id: str):
+        self.documents.pop(id, None)
+
+    def clear(self):
+        self.documents.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self.documents),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": (self.hits / total) if total else 0.0,
+        }
+
+
 class DatabaseManager:
     class DatabaseException(ValueError):
         pass
 
-    def __init__(self, base_url: str, dbname: str, username: str, password: str):
+    def __init__(
+        self,
+        base_url: str,
+        dbname: str,
+        username: str,
+        password: str,
+        cache_size: int = 10000,
+        write_behind: bool = False,
+    ):
         self.dbname = dbname
         self.username = username
         self.password = password
         self.managers = dict()
+        self.cache = DocumentCache(cache_size)
+        # If write_behind is enabled, eligible patches are held in self.pending
+        # (Document ID -> combined patch) until flush() is called. The game loop
+        # does this once per tick, and query() does it first if anything is held,
+        # as AQL can't see buffered writes.
+        self.write_behind = write_behind
+        self.pending: dict[str, dict] = dict()
+        # Cached Documents with a buffered patch layered over them get a _rev of
+        # their own, so that anything keyed on _rev sees that they have changed.
+        self.buffered_revs = itertools.count()
         self.client = httpx.AsyncClient(base_url=base_url, http2=True)
         self.dbclient = httpx.AsyncClient(
             base_url=f"{base_url}/_db/{dbname}", http2=True
@@ -141,18 +286,255 @@ class DatabaseManager:
             )
         return proxy_class(data.get("_id"), self)
 
-    async def getDocument(self, id: str, proxy=True):
-        result = await self.get(f"/_api/document/{id}")
-        if result.status_code != 200:
-            raise self.DatabaseException(
-                f"Cannot retrieve Document ID '{id}': {result.text}"
-            )
-        data = result.json()
+    async def getDocument(self, id: str, proxy=True, validate=False):
+        """
+        Retrieve a Document, serving it from the cache when possible.
+
+        If validate is True, a cached Document is checked against the database's
+        current _rev first. This is still a round trip, but the body is only
+        transferred if the Document has changed.
+        """
+        data = self.cache.get(id)
+        if data is None or validate:
+            headers = dict()
+            if data is not None and (rev := data.get("_rev", None)):
+                headers["If-None-Match"] = f'"{rev}"'
+            result = await self.get(f"/_api/document/{id}", headers=headers)
+            if result.status_code == 200:
+                data = self._remember(result.json())
+            elif result.status_code != 304:
+                self.cache.discard(id)
+                raise self.DatabaseException(
+                    f"Cannot retrieve Document ID '{id}': {result.text}"
+                )
         if not proxy:
             return data
         return await self.getProxy(data)
 
+    async def getDocuments(self, ids, proxy=True) -> list:
+        """
+        Retrieve many Documents at once. Anything not already cached is fetched in
+        a single query rather than one request per Document.
+
+        Results are returned in the order of ids, with duplicates removed. IDs which
+        do not exist are silently skipped.
+        """
+        found = dict()
+        missing = list()
+        ids = list(dict.fromkeys(ids))
+        for id in ids:
+            if (data := self.cache.get(id)) is not None:
+                found[id] = data
+            else:
+                missing.append(id)
+
+        if missing:
+            async for doc in self._query(
+                "FOR doc IN DOCUMENT(@ids) RETURN doc", ids=missing
+            ):
+                found[doc["_id"]] = self._remember(doc)
+
+        out = [found[id] for id in ids if id in found]
+        if not proxy:
+            return out
+        return [await self.getProxy(data) for data in out]
+
+    async def getFields(self, id: str, fields) -> dict:
+        """
+        Retrieve only the given top-level fields of a Document. A cached Document is
+        used if available, otherwise only the requested attributes are sent over the
+        wire. Projected Documents are never cached.
+        """
+        fields = list(fields)
+        if (data := self.cache.get(id)) is not None:
+            return {k: data[k] for k in fields if k in data}
+        async for doc in self._query(
+            """
+            FOR doc IN [DOCUMENT(@id)]
+            FILTER doc != null
+            RETURN KEEP(doc, @fields)
+            """,
+            id=id,
+            fields=fields,
+        ):
+            if self._layer_pending(id, doc):
+                return {k: doc[k] for k in fields if k in doc}
+            return doc
+        raise self.DatabaseException(f"Cannot retrieve Document ID '{id}'")
+
+    def _remember(self, doc: dict) -> dict:
+        """
+        Cache a Document retrieved from the database, layering any pending
+        write-behind patch over it so that reads always see buffered writes.
+        """
+        if doc and self._layer_pending(doc.get("_id", None), doc):
+            self.cache.store(doc, force=True)
+        else:
+            self.cache.store(doc)
+        return doc
+
+    def _layer_pending(self, id: str, doc: dict) -> bool:
+        """
+        Apply the patch buffered for id, if there is one, to doc and give it a _rev
+        of its own. Returns whether there was.
+        """
+        if (patch := self.pending.get(id, None)) is None:
+            return False
+        merge_patch(doc, orjson.loads(orjson.dumps(patch)))
+        if "_rev" in doc:
+            doc["_rev"] = self._buffered_rev(doc["_rev"])
+        return True
+
+    def _buffered_rev(self, rev: str) -> str:
+        return f"{rev.split('+', 1)[0]}+{next(self.buffered_revs)}"
+
+    def _store_result(self, id: str, result):
+        """
+        Write-through for document write endpoints called with returnNew.
+        """
+        if result.status_code in (200, 201, 202) and (
+            new_doc := result.json().get("new", None)
+        ):
+            self._remember(new_doc)
+        else:
+            self.cache.discard(id)
+
+    def _can_buffer(self, data: dict, kwargs) -> bool:
+        if not self.write_behind or set(kwargs) - {"params"}:
+            return False
+        params = kwargs.get("params", dict())
+        if set(params) - {"keepNull"}:
+            return False
+        # Without keepNull=false a None is stored as null, not removed, which
+        # the combined patch cannot express.
+        return params.get("keepNull", "true") == "false" or not contains_none(data)
+
+    def _buffer_patch(self, id: str, data: dict):
+        data = orjson.loads(orjson.dumps(data))
+        if (patch := self.pending.get(id, None)) is not None:
+            combine_patches(patch, data)
+        else:
+            self.pending[id] = data
+        if (doc := self.cache.get(id)) is not None:
+            merge_patch(doc, orjson.loads(orjson.dumps(data)))
+            if "_rev" in doc:
+                doc["_rev"] = self._buffered_rev(doc["_rev"])
+            self.cache.store(doc, force=True)
+
+    def _restore_pending(self, pending: dict):
+        """
+        Put patches which couldn't be written back in front of anything buffered
+        for the same Documents since.
+        """
+        for id, patch in pending.items():
+            if (later := self.pending.get(id, None)) is not None:
+                combine_patches(patch, later)
+            self.pending[id] = patch
+
+    async def flush(self, ids=None):
+        """
+        Write out buffered patches, either all of them or only those for the given
+        Document IDs. Each collection is written with a single UPDATE query.
+
+        If a query fails, the patches not yet written are buffered again and the
+        error is raised. Documents which couldn't be updated, such as ones deleted
+        from outside, are dropped from the cache along with their patches.
+        """
+        if ids is None:
+            pending, self.pending = self.pending, dict()
+        else:
+            pending = {
+                id: patch
+                for id in ids
+                if (patch := self.pending.pop(id, None)) is not None
+            }
+        if not pending:
+            return
+
+        collections = dict()
+        for id, patch in pending.items():
+            collection, key = id.split("/", 1)
+            collections.setdefault(collection, list()).append(
+                {"key": key, "data": patch}
+            )
+
+        for collection, patches in collections.items():
+            try:
+                async for doc in self._query(
+                    """
+                    FOR p IN @patches
+                    UPDATE p.key WITH p.data IN @@collection OPTIONS {keepNull: false, ignoreErrors: true}
+                    RETURN NEW
+                    """,
+                    patches=patches,
+                    **{"@collection": collection},
+                ):
+                    if doc:
+                        pending.pop(doc["_id"], None)
+                        self._remember(doc)
+            except self.DatabaseException:
+                self._restore_pending(pending)
+                raise
+            for p in patches:
+                if (id := f"{collection}/{p['key']}") in pending:
+                    del pending[id]
+                    self.cache.discard(id)
+                    logging.warning(f"Buffered patch for Document ID '{id}' failed.")
+
+    def _normalize(self, id: str, data: dict) -> dict:
+        if manager := self.managers.get(id.split("/", 1)[0], None):
+            return manager.normalize(data)
+        return data
+
+    async def patchDocument(self, id: str, data: dict, **kwargs):
+        """
+        PATCH a Document. With write_behind enabled, the patch is usually buffered
+        until the next flush() and None is returned instead of a response.
+        """
+        data = self._normalize(id, data)
+        if self._can_buffer(data, kwargs):
+            if (patch := self.pending.get(id, None)) and patches_conflict(patch, data):
+                await self.flush([id])
+            self._buffer_patch(id, data)
+            return None
+        if id in self.pending:
+            await self.flush([id])
+        params = kwargs.pop("params", dict())
+        params["returnNew"] = "true"
+        result = await self.patch(
+            f"/_api/document/{id}", json=data, params=params, **kwargs
+        )
+        self._store_result(id, result)
+        return result
+
+    async def putDocument(self, id: str, data: dict, **kwargs):
+        # A replace supersedes anything still buffered.
+        self.pending.pop(id, None)
+        data = self._normalize(id, data)
+        params = kwargs.pop("params", dict())
+        params["returnNew"] = "true"
+        result = await self.put(
+            f"/_api/document/{id}", json=data, params=params, **kwargs
+        )
+        self._store_result(id, result)
+        return result
+
+    async def deleteDocument(self, id: str, **kwargs):
+        self.pending.pop(id, None)
+        self.cache.discard(id)
+        return await self.delete(f"/_api/document/{id}", **kwargs)
+
     async def query(self, query: str, **kwargs):
+        if self.pending:
+            await self.flush()
+        async for doc in self._query(query, **kwargs):
+            yield doc
+
+    async def _query(self, query: str, **kwargs):
+        """
+        Run an AQL query without first flushing buffered patches, for callers which
+        account for them or write them.
+        """
         query_data = dict()
         query_data["query"] = query
         if kwargs:
@@ -167,14 +549,45 @@ class DatabaseManager:
 
     async def query_proxy(self, query: str, **kwargs):
         async for doc in self.query(query, **kwargs):
+            self._remember(doc)
             yield await self.getProxy(doc)
 
+    async def query_proxy_fields(self, query: str, fields, **kwargs):
+        """
+        Like query_proxy, but only the given fields of each returned Document are
+        transferred. Yields (proxy, data) pairs, where data holds _id, proxy, and
+        whatever of the requested fields the Document has.
+
+        The bind variable @projection_fields is reserved for this.
+        """
+        if "projection_fields" in kwargs:
+            raise self.DatabaseException("projection_fields is a reserved bind var.")
+        projected = f"""
+        FOR projected IN (
+        {query}
+        )
+        RETURN KEEP(projected, @projection_fields)
+        """
+        kwargs["projection_fields"] = list({"_id", "proxy", *fields})
+        async for doc in self.query(projected, **kwargs):
+            yield await self.getProxy(doc), doc
+
 
 class CollectionManager:
     name = None
     edge = False
     proxy = None
 
+    # Index definitions ensured at startup. Each is passed as-is to ArangoDB's
+    # index API, so persistent, ttl, unique and sparse indexes are all supported.
+    # Example: {"type": "persistent", "fields": ["name_lower"], "unique": True}
+    indexes: list[dict] = list()
+
+    # Fields which are also stored lowercased under another name, so that
+    # case-insensitive lookups can hit an index instead of calling LOWER() on
+    # every document. Maps source field -> normalized field.
+    lowercase_fields: dict[str, str] = dict()
+
     async def create_collection(self):
         results = await self.get(f"/_api/collection/{self.name}")
         if results.status_code == 404:
@@ -188,7 +601,76 @@ class CollectionManager:
                 )
 
     async def create_supplemental(self):
-        pass
+        await self.backfill_lowercase()
+        await self.create_indexes()
+
+    async def create_indexes(self):
+        for index in self.indexes:
+            if index.get("unique", False) and (
+                duplicates := await self.find_duplicates(index)
+            ):
+                found = "; ".join(
+                    f"{values} ({', '.join(ids)})" for values, ids in duplicates.items()
+                )
+                logging.warning(
+                    f"Not creating unique index {index} on {self.name}, as these "
+                    f"Documents share values for it: {found}"
+                )
+                continue
+            results = await self.post(
+                "/_api/index", json=index, params={"collection": self.name}
+            )
+            if results.status_code not in (200, 201):
+                raise self.dbmanager.DatabaseException(
+                    f"Could not create index {index} on {self.name}: {results.text}"
+                )
+
+    async def find_duplicates(self, index: dict) -> dict[str, list[str]]:
+        """
+        The IDs of Documents which would violate a unique index, by the values they
+        share (JSON encoded).
+        """
+        fields = index["fields"]
+        groups = dict()
+        async for doc in self.dbmanager.query(
+            "FOR doc IN @@collection RETURN KEEP(doc, @fields)",
+            fields=["_id", *fields],
+            **{"@collection": self.name},
+        ):
+            values = [doc.get(field, None) for field in fields]
+            if index.get("sparse", False) and None in values:
+                continue
+            groups.setdefault(orjson.dumps(values).decode(), list()).append(doc["_id"])
+        return {values: ids for values, ids in groups.items() if len(ids) > 1}
+
+    async def backfill_lowercase(self):
+        """
+        Populate normalized fields for Documents written before they existed.
+        """
+        for field, normalized in self.lowercase_fields.items():
+            async for id in self.dbmanager.query(
+                """
+                FOR doc IN @@collection
+                FILTER IS_STRING(doc.@field) && doc.@normalized != LOWER(doc.@field)
+                UPDATE doc WITH {[@normalized]: LOWER(doc.@field)} IN @@collection
+                RETURN NEW._id
+                """,
+                **{"@collection": self.name, "field": field, "normalized": normalized},
+            ):
+                self.dbmanager.cache.discard(id)
+
+    def normalize(self, data: dict) -> dict:
+        """
+        Returns data with lowercase_fields filled in for any source fields it sets.
+        """
+        if not any(field in data for field in self.lowercase_fields):
+            return data
+        data = dict(data)
+        for field, normalized in self.lowercase_fields.items():
+            if field in data:
+                value = data[field]
+                data[normalized] = value.lower() if isinstance(value, str) else None
+        return data
 
     async def initialize(self):
         await self.create_collection()
@@ -231,7 +713,14 @@ class CollectionManager:
         ):
             yield doc
 
+    async def all_proxy_fields(self, fields):
+        async for proxy, data in self.dbmanager.query_proxy_fields(
+            f"FOR doc IN {self.name} RETURN doc", fields
+        ):
+            yield proxy, data
+
     async def create_document(self, data: dict, key=None):
+        data = self.normalize(data)
         if key is not None:
             data["_key"] = str(key)
         if self.proxy and "proxy" not in data:
@@ -243,6 +732,7 @@ class CollectionManager:
         if result.status_code not in (201, 202):
             raise ValueError(f"Could not create {self.name}: {result.text}")
         new_doc = result.json().get("new")
+        self.dbmanager.cache.store(new_doc)
         return (
             (await self.dbmanager.getProxy(new_doc)) if "proxy" in new_doc else new_doc
         )
@@ -255,6 +745,11 @@ class CollectionManager:
 
 
 class DocumentProxy:
+    # If True, get_field() retrieves only the requested field when the Document
+    # isn't cached, rather than downloading the whole thing. Useful for proxies
+    # whose Documents can grow large.
+    project_fields = False
+
     def __init__(self, id, dbmanager: DatabaseManager):
         self.id = id
         self.dbmanager = dbmanager
@@ -276,13 +771,13 @@ class DocumentProxy:
         return await self.dbmanager.getDocument(self.id, proxy=False)
 
     async def patchDocument(self, data: dict, **kwargs):
-        await self.dbmanager.patch(f"/_api/document/{self.id}", json=data, **kwargs)
+        await self.dbmanager.patchDocument(self.id, data, **kwargs)
 
     async def putDocument(self, data, **kwargs):
-        await self.dbmanager.put(f"/_api/document/{self.id}", json=data, **kwargs)
+        await self.dbmanager.putDocument(self.id, data, **kwargs)
 
     async def deleteDocument(self):
-        await self.dbmanager.delete(f"/_api/document/{self.id}")
+        await self.dbmanager.deleteDocument(self.id)
 
     async def set_field(self, name: str, value=None):
         params = dict()
@@ -292,7 +787,20 @@ class DocumentProxy:
             value = value.id
         await self.patchDocument(data={name: value}, params=params)
 
+    async def get_fields(self, names, default=None) -> dict:
+        """
+        Retrieve several fields at once, without downloading the whole Document.
+        Missing fields are set to default.
+        """
+        try:
+            data = await self.dbmanager.getFields(self.id, names)
+        except Exception as err:
+            data = dict()
+        return {name: data.get(name, default) for name in names}
+
     async def get_field(self, name: str, default=None):
+        if self.project_fields:
+            return (await self.get_fields([name], default=default))[name]
         try:
             doc = await self.getDocument()
             return doc.get(name, default)
@@ -22,5 +22,13 @@ async def Command(session, message):
     await session.send_text(f"Oops, cannot handle: {command}")
 
 
+async def Commands(session, message):
+    """
+    Several lines of input which arrived together, handled in order.
+    """
+    for command in message.get("data", list()):
+        await Command(session, {"data": command})
+
+
 async def GMCP(session, message):
     pass
@@ -0,0 +1,89 @@
+from origin.utils.grid import cell_key
+from .core import CollectionManager
+
+
+class GridChunkManager(CollectionManager):
+    """
+    Features of chunked Grids, one Document per chunk_size square of cells.
+
+    A chunk's _key is "<grid key>:<chunk x>:<chunk y>", so the chunks covering an
+    area can be fetched by ID without a query. Its features are an object keyed by
+    cell_key(x, y), so single cells can be changed with a PATCH.
+    """
+
+    name = "grid_chunk"
+    indexes = [
+        {"type": "persistent", "fields": ["grid", "x", "y"], "unique": True},
+    ]
+
+    def chunk_id(self, grid_id: str, cx: int, cy: int) -> str:
+        return f"{self.name}/{grid_id.split('/', 1)[1]}:{cx}:{cy}"
+
+    def chunk_features(self, grid_id: str, features, chunk_size: int) -> list[dict]:
+        """
+        Partition a Grid's [coordinates, data] features into chunk Documents.
+        """
+        chunks = dict()
+        grid_key = grid_id.split("/", 1)[1]
+        for (x, y), data in features or []:
+            cx, cy = x // chunk_size, y // chunk_size
+            if (chunk := chunks.get((cx, cy), None)) is None:
+                chunk = {
+                    "_key": f"{grid_key}:{cx}:{cy}",
+                    "grid": grid_id,
+                    "x": cx,
+                    "y": cy,
+                    "features": dict(),
+                }
+                chunks[(cx, cy)] = chunk
+            chunk["features"][cell_key(x, y)] = data
+        return list(chunks.values())
+
+    async def delete_chunks(self, grid_id: str):
+        async for id in self.dbmanager.query(
+            """
+            FOR c IN grid_chunk
+            FILTER c.grid == @grid
+            REMOVE c IN grid_chunk
+            RETURN OLD._id
+            """,
+            grid=grid_id,
+        ):
+            self.dbmanager.cache.discard(id)
+
+    async def migrate_grid(self, grid: "Grid", chunk_size: int = 16) -> int:
+        """
+        Move a Grid's features out of its Document and into chunk Documents.
+        Returns how many chunks were written.
+        """
+        doc = await grid.getDocument()
+        data = doc.get("grid", None) or dict()
+        chunks = self.chunk_features(grid.id, data.get("features", None), chunk_size)
+        await self.delete_chunks(grid.id)
+        for i in range(0, len(chunks), 1000):
+            async for _ in self.dbmanager.query(
+                "FOR c IN @chunks INSERT c INTO grid_chunk",
+                chunks=chunks[i : i + 1000],
+            ):
+                pass
+        await grid.patchDocument(
+            {"grid_chunk_size": chunk_size, "grid": {"features": None}},
+            params={"keepNull": "false"},
+        )
+        grid.spatial_indexes.discard(grid.id)
+        for chunk in chunks:
+            grid.spatial_indexes.discard(f"{self.name}/{chunk['_key']}")
+        return len(chunks)
+
+    async def migrate(self, chunk_size: int = 16) -> dict[str, int]:
+        """
+        Migrate every Grid which still keeps its features in its own Document.
+        Returns how many chunks each migrated Grid was given.
+        """
+        query = """
+        FOR doc IN object
+        FILTER doc.proxy == "grid" && doc.grid_chunk_size == null
+        RETURN doc
+        """
+        grids = [grid async for grid in self.dbmanager.query_proxy(query)]
+        return {grid.id: await self.migrate_grid(grid, chunk_size) for grid in grids}
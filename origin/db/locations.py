@@ -1,5 +1,7 @@
 from typing import List, Tuple
 
+import origin
+
 from .core import DocumentProxy, CollectionManager
 
 
@@ -7,6 +9,11 @@ class LocationManager(CollectionManager):
     name = "location"
     proxy = "location"
     edge = True
+    indexes = [
+        {"type": "persistent", "fields": ["_from", "proxy"]},
+        {"type": "persistent", "fields": ["_to", "proxy"]},
+        {"type": "persistent", "fields": ["_to", "proxy", "x", "y"], "sparse": True},
+    ]
 
 
 class Location(DocumentProxy):
@@ -16,23 +23,59 @@ class Location(DocumentProxy):
         """
         This will probably be overloaded and called via super to add more filtering.
         """
-        data = await self.getDocument()
         async for doc in self.dbmanager.query_proxy(
             """
             FOR doc IN location
             FILTER doc._to == @loc && doc.proxy == @proxy
             RETURN DOCUMENT(doc._from)
         """,
-            loc=data.get("_to"),
+            loc=await self.get_field("_to"),
             proxy=self.proxy_name,
         ):
             if doc == obj:
                 continue
-            yield obj
+            yield doc
+
+    async def get_neighbor_ids(self, obj) -> list[str]:
+        """
+        The IDs of everything get_neighbors() would yield.
+        """
+        return [
+            id
+            async for id in self.dbmanager.query(
+                """
+                FOR doc IN location
+                FILTER doc._to == @loc && doc.proxy == @proxy && doc._from != @obj
+                RETURN doc._from
+            """,
+                loc=await self.get_field("_to"),
+                proxy=self.proxy_name,
+                obj=obj.id,
+            )
+        ]
+
+    async def search_neighbor_ids(self, obj, text: str) -> list[str]:
+        """
+        The IDs of neighbors with a keyword starting with text. This may include
+        ones which don't, if it can't be narrowed down cheaply.
+        """
+        if origin.CONTENTS_INDEX is None:
+            return await self.get_neighbor_ids(obj)
+        container = await self.get_proxy("_to")
+        ids = await origin.CONTENTS_INDEX.search(container, self.proxy_name, text)
+        return [id for id in ids if id != obj.id]
 
     async def render_appearance(self, obj):
         pass
 
+    def command_source(self):
+        """
+        A hashable key for the commands get_commands() provides, or None if there are
+        none. Locations which return the same key must provide the same commands, as
+        the compiled command table is cached per key.
+        """
+        return None
+
     async def get_commands(self, obj):
         return list()
 
@@ -48,14 +91,72 @@ class EquipmentLocation(Location):
 class GridLocation(Location):
     proxy_name = "grid_location"
 
+    # How many tiles away, in any direction, neighbors may be. Things further away
+    # than this aren't considered by searches and the like.
+    neighbor_radius = 10
+
+    async def ids_within(
+        self, radius: int, exclude: str = None, position: tuple[int, int] = None
+    ) -> list[str]:
+        """
+        The IDs of everything on this Grid within radius tiles of position, or of
+        this location, nearest first. Served by the (_to, proxy, x, y) index, so it
+        scales with how crowded the area is rather than how populated the Grid is.
+        """
+        doc = await self.get_fields(["_to", "x", "y"], default=0)
+        if position is None:
+            position = (doc["x"], doc["y"])
+        x, y = position
+        return [
+            id
+            async for id in self.dbmanager.query(
+                """
+                FOR doc IN location
+                FILTER doc._to == @grid && doc.proxy == @proxy
+                FILTER doc.x >= @min_x && doc.x <= @max_x
+                FILTER doc.y >= @min_y && doc.y <= @max_y
+                FILTER doc._from != @exclude
+                SORT MAX([ABS(doc.x - @x), ABS(doc.y - @y)])
+                RETURN doc._from
+                """,
+                grid=doc["_to"],
+                proxy=self.proxy_name,
+                min_x=x - radius,
+                max_x=x + radius,
+                min_y=y - radius,
+                max_y=y + radius,
+                x=x,
+                y=y,
+                exclude=exclude,
+            )
+        ]
+
+    async def objects_within(self, radius: int, exclude=None):
+        """
+        Yield everything on this Grid within radius tiles, nearest first.
+        """
+        ids = await self.ids_within(radius, exclude=exclude.id if exclude else None)
+        for obj in await self.dbmanager.getDocuments(ids):
+            yield obj
+
+    async def get_neighbors(self, obj):
+        async for found in self.objects_within(self.neighbor_radius, exclude=obj):
+            yield found
+
+    async def get_neighbor_ids(self, obj) -> list[str]:
+        return await self.ids_within(self.neighbor_radius, exclude=obj.id)
+
+    async def search_neighbor_ids(self, obj, text: str) -> list[str]:
+        return await self.get_neighbor_ids(obj)
+
     async def render_appearance(self, obj):
-        doc = await self.getDocument()
+        doc = await self.get_fields(["x", "y"], default=0)
         grid = await self.get_proxy("_to")
-        gdoc = await grid.getDocument()
+        gdoc = await grid.get_fields(["grid_description"])
         message = dict()
-        if desc := gdoc.get("grid_description", ""):
+        if desc := gdoc["grid_description"]:
             message["grid_description"] = desc
-        start = (doc.get("x", 0), doc.get("y", 0))
-        surroundings = await grid.get_surroundings(start=start, doc=gdoc)
+        start = (doc["x"], doc["y"])
+        surroundings = await grid.get_surroundings(start=start)
         message["surroundings"] = surroundings
         await obj.send_event("GridDescription", message)
@@ -0,0 +1,392 @@
+"""
+An in-process stand-in for ArangoDB.
+
+MemoryDatabaseManager is a drop-in DatabaseManager whose HTTP clients are wired to an
+in-process httpx transport instead of a socket. Every request origin makes is served by
+MemoryStore, so the whole DatabaseManager code path (cache, cursors, write-behind) runs
+unchanged. Select it with:
+
+    SERVER_CLASSES["database"] = "origin.db.memory.MemoryDatabaseManager"
+
+Nothing is persisted; the store is deterministic apart from DATE_NOW().
+"""
+
+import copy
+import time
+import httpx
+import jwt
+import orjson
+
+from .aql import Query, AQLError
+from .core import DatabaseManager
+
+
+class StoreError(ValueError):
+    def __init__(self, message: str, code: int, error_num: int):
+        super().__init__(message)
+        self.code = code
+        self.error_num = error_num
+
+
+def not_found(what: str) -> StoreError:
+    return StoreError(f"{what} not found", 404, 1202)
+
+
+def apply_patch(target: dict, patch: dict, keep_null: bool, merge_objects: bool):
+    for k, v in patch.items():
+        if v is None and not keep_null:
+            target.pop(k, None)
+        elif merge_objects and isinstance(v, dict):
+            existing = target.get(k, None)
+            existing = dict(existing) if isinstance(existing, dict) else dict()
+            target[k] = apply_patch(existing, v, keep_null, merge_objects)
+        else:
+            target[k] = copy.deepcopy(v)
+    return target
+
+
+def option(value, default: bool) -> bool:
+    if value is None:
+        return default
+    if isinstance(value, str):
+        return value.lower() == "true"
+    return bool(value)
+
+
+class MemoryCollection:
+    def __init__(self, name: str, edge: bool = False):
+        self.name = name
+        self.edge = edge
+        self.documents: dict[str, dict] = dict()
+        self.indexes: list[dict] = list()
+
+    def info(self) -> dict:
+        return {"name": self.name, "type": 3 if self.edge else 2, "status": 3}
+
+
+class MemoryStore:
+    """
+    Holds collections and documents, and implements the document-level semantics the
+    HTTP API and AQL share: key and revision generation, PATCH merging, edge checks,
+    and unique index enforcement.
+    """
+
+    SYSTEM_FIELDS = ("_id", "_key", "_rev")
+
+    def __init__(self):
+        self.collections: dict[str, MemoryCollection] = dict()
+        self.key_counter = 0
+        self.rev_counter = 0
+        self.cursors: dict[str, list] = dict()
+        self.cursor_counter = 0
+        self.index_counter = 0
+
+    def collection(self, name: str) -> MemoryCollection:
+        if not (found := self.collections.get(name, None)):
+            raise StoreError(f"collection or view not found: {name}", 404, 1203)
+        return found
+
+    def create_collection(self, name: str, edge: bool = False) -> MemoryCollection:
+        if name in self.collections:
+            raise StoreError(f"duplicate name: {name}", 409, 1207)
+        coll = MemoryCollection(name, edge)
+        self.collections[name] = coll
+        return coll
+
+    def ensure_index(self, name: str, definition: dict) -> tuple[dict, bool]:
+        coll = self.collection(name)
+        wanted = {k: v for k, v in definition.items() if k != "name"}
+        for index in coll.indexes:
+            if all(index.get(k, None) == v for k, v in wanted.items()):
+                return index, False
+        self.index_counter += 1
+        index = dict(definition)
+        index["id"] = f"{name}/{self.index_counter}"
+        index.setdefault("unique", False)
+        index.setdefault("sparse", False)
+        coll.indexes.append(index)
+        return index, True
+
+    def next_rev(self) -> str:
+        self.rev_counter += 1
+        return f"_{self.rev_counter:012d}"
+
+    def scan(self, name: str) -> list[dict]:
+        return list(self.collection(name).documents.values())
+
+    def lookup(self, id: str) -> dict | None:
+        if not isinstance(id, str) or "/" not in id:
+            return None
+        name, key = id.split("/", 1)
+        if not (coll := self.collections.get(name, None)):
+            return None
+        return coll.documents.get(key, None)
+
+    def get(self, name: str, key: str) -> dict:
+        if (doc := self.collection(name).documents.get(key, None)) is None:
+            raise not_found("document")
+        return doc
+
+    def resolve_key(self, target) -> str:
+        if isinstance(target, dict):
+            target = target.get("_key", None)
+        if not isinstance(target, str) or not target:
+            raise StoreError("invalid document key", 400, 1221)
+        return target
+
+    def check(self, coll: MemoryCollection, doc: dict):
+        if coll.edge and not (
+            isinstance(doc.get("_from", None), str)
+            and isinstance(doc.get("_to", None), str)
+        ):
+            raise StoreError("edge attribute missing or invalid", 400, 1233)
+        for index in coll.indexes:
+            if not index.get("unique", False):
+                continue
+            values = [doc.get(f, None) for f in index.get("fields", [])]
+            if index.get("sparse", False) and None in values:
+                continue
+            for other in coll.documents.values():
+                if other["_key"] == doc["_key"]:
+                    continue
+                if [other.get(f, None) for f in index["fields"]] == values:
+                    raise StoreError("unique constraint violated", 409, 1210)
+
+    def insert(self, name: str, data: dict) -> dict:
+        coll = self.collection(name)
+        if not isinstance(data, dict):
+            raise StoreError("invalid document type", 400, 1227)
+        doc = copy.deepcopy(data)
+        if not (key := doc.get("_key", None)):
+            self.key_counter += 1
+            key = str(self.key_counter)
+        key = str(key)
+        if key in coll.documents:
+            raise StoreError("unique constraint violated", 409, 1210)
+        doc["_key"] = key
+        doc["_id"] = f"{name}/{key}"
+        doc["_rev"] = self.next_rev()
+        self.check(coll, doc)
+        coll.documents[key] = doc
+        return doc
+
+    def update(self, name: str, key: str, data: dict, options: dict) -> tuple:
+        coll = self.collection(name)
+        old = self.get(name, key)
+        if not isinstance(data, dict):
+            raise StoreError("invalid document type", 400, 1227)
+        patch = {k: v for k, v in data.items() if k not in self.SYSTEM_FIELDS}
+        new = apply_patch(
+            dict(old),
+            patch,
+            option(options.get("keepNull", None), True),
+            option(options.get("mergeObjects", None), True),
+        )
+        new["_rev"] = self.next_rev()
+        self.check(coll, new)
+        coll.documents[key] = new
+        return old, new
+
+    def replace(self, name: str, key: str, data: dict) -> tuple:
+        coll = self.collection(name)
+        old = self.get(name, key)
+        if not isinstance(data, dict):
+            raise StoreError("invalid document type", 400, 1227)
+        new = {
+            k: copy.deepcopy(v) for k, v in data.items() if k not in self.SYSTEM_FIELDS
+        }
+        new.update({"_key": key, "_id": old["_id"], "_rev": self.next_rev()})
+        self.check(coll, new)
+        coll.documents[key] = new
+        return old, new
+
+    def delete(self, name: str, key: str) -> dict:
+        old = self.get(name, key)
+        del self.collection(name).documents[key]
+        return old
+
+    # Hooks for AQL data modification.
+    def modify(self, mode: str, name: str, target, data, options: dict):
+        try:
+            key = self.resolve_key(target)
+            if data is None:
+                data = target
+            if mode == "update":
+                return self.update(name, key, data, options)
+            return self.replace(name, key, data)
+        except StoreError:
+            if options.get("ignoreErrors", False):
+                return None
+            raise
+
+    def remove(self, name: str, target, options: dict):
+        try:
+            return self.delete(name, self.resolve_key(target))
+        except StoreError:
+            if options.get("ignoreErrors", False):
+                return None
+            raise
+
+    # Cursors
+    def create_cursor(self, results: list, batch_size: int) -> dict:
+        batch, rest = results[:batch_size], results[batch_size:]
+        out = {"result": batch, "hasMore": bool(rest), "error": False, "code": 201}
+        if rest:
+            self.cursor_counter += 1
+            cursor_id = str(self.cursor_counter)
+            self.cursors[cursor_id] = [rest, batch_size, 1]
+            out["id"] = cursor_id
+            out["nextBatchId"] = "2"
+        return out
+
+    def next_batch(self, cursor_id: str) -> dict:
+        if not (found := self.cursors.get(cursor_id, None)):
+            raise StoreError("cursor not found", 404, 1600)
+        rest, batch_size, batch_id = found
+        batch, rest = rest[:batch_size], rest[batch_size:]
+        out = {"result": batch, "hasMore": bool(rest), "id": cursor_id, "code": 200}
+        if rest:
+            found[0] = rest
+            found[2] = batch_id + 1
+            out["nextBatchId"] = str(batch_id + 2)
+        else:
+            del self.cursors[cursor_id]
+        return out
+
+
+class MemoryTransport(httpx.AsyncBaseTransport):
+    """
+    Routes the subset of the ArangoDB HTTP API that origin uses to a MemoryStore.
+    """
+
+    def __init__(self, store: MemoryStore, dbname: str):
+        self.store = store
+        self.prefix = f"/_db/{dbname}"
+        self.queries: dict[str, Query] = dict()
+        self.secret = "origin-memory-database-signing-secret"
+
+    def respond(self, status: int, data=None, headers=None) -> httpx.Response:
+        content = orjson.dumps(data) if data is not None else b""
+        headers = dict(headers or dict())
+        headers["Content-Type"] = "application/json"
+        return httpx.Response(status, content=content, headers=headers)
+
+    def error(self, err: StoreError | AQLError) -> httpx.Response:
+        code = getattr(err, "code", 400)
+        return self.respond(
+            code,
+            {
+                "error": True,
+                "code": code,
+                "errorNum": err.error_num,
+                "errorMessage": str(err),
+            },
+        )
+
+    def compile(self, text: str) -> Query:
+        if not (query := self.queries.get(text, None)):
+            query = Query(text)
+            self.queries[text] = query
+        return query
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        if path.startswith(self.prefix):
+            path = path[len(self.prefix) :]
+        body = None
+        if content := await request.aread():
+            body = orjson.loads(content)
+        params = dict(request.url.params)
+        parts = [p for p in path.split("/") if p]
+        try:
+            return self.route(request, parts, params, body)
+        except (StoreError, AQLError) as err:
+            return self.error(err)
+
+    def route(self, request, parts: list[str], params: dict, body) -> httpx.Response:
+        method = request.method
+        match parts:
+            case ["_open", "auth"]:
+                token = jwt.encode(
+                    {"exp": time.time() + 3600, "preferred_username": body["username"]},
+                    self.secret,
+                    algorithm="HS256",
+                )
+                return self.respond(200, {"jwt": token})
+            case ["_api", "database", "current"]:
+                return self.respond(200, {"result": {"name": self.prefix[5:]}})
+            case ["_api", "collection"] if method == "POST":
+                coll = self.store.create_collection(
+                    body["name"], body.get("type", 2) == 3
+                )
+                return self.respond(200, coll.info())
+            case ["_api", "collection", name]:
+                return self.respond(200, self.store.collection(name).info())
+            case ["_api", "collection", name, "count"]:
+                coll = self.store.collection(name)
+                return self.respond(200, coll.info() | {"count": len(coll.documents)})
+            case ["_api", "index"] if method == "POST":
+                index, created = self.store.ensure_index(params["collection"], body)
+                return self.respond(201 if created else 200, index)
+            case ["_api", "document", name] if method == "POST":
+                doc = self.store.insert(name, body)
+                return self.respond(202, self.write_result(doc, None, params))
+            case ["_api", "document", name, key]:
+                return self.route_document(request, name, key, params, body)
+            case ["_api", "cursor"] if method == "POST":
+                query = self.compile(body["query"])
+                results, writes = query.execute(self.store, body.get("bindVars", None))
+                cursor = self.store.create_cursor(results, body.get("batchSize", 1000))
+                cursor["extra"] = {"stats": {"writesExecuted": writes}}
+                return self.respond(201, cursor)
+            case ["_api", "cursor", cursor_id] if method in ("POST", "PUT"):
+                return self.respond(200, self.store.next_batch(cursor_id))
+            case ["_api", "cursor", cursor_id] if method == "DELETE":
+                if self.store.cursors.pop(cursor_id, None) is None:
+                    raise StoreError("cursor not found", 404, 1600)
+                return self.respond(202, {"id": cursor_id, "error": False})
+        raise StoreError(f"unknown path {request.url.path}", 404, 404)
+
+    def write_result(self, new: dict, old: dict | None, params: dict) -> dict:
+        out = {"_id": new["_id"], "_key": new["_key"], "_rev": new["_rev"]}
+        if old is not None:
+            out["_oldRev"] = old["_rev"]
+        if option(params.get("returnNew", None), False):
+            out["new"] = new
+        if old is not None and option(params.get("returnOld", None), False):
+            out["old"] = old
+        return out
+
+    def route_document(self, request, name, key, params, body) -> httpx.Response:
+        match request.method:
+            case "GET" | "HEAD":
+                doc = self.store.get(name, key)
+                etag = f'"{doc["_rev"]}"'
+                if request.headers.get("If-None-Match", None) == etag:
+                    return self.respond(304, headers={"ETag": etag})
+                return self.respond(200, doc, headers={"ETag": etag})
+            case "PATCH":
+                old, new = self.store.update(name, key, body, params)
+                return self.respond(202, self.write_result(new, old, params))
+            case "PUT":
+                old, new = self.store.replace(name, key, body)
+                return self.respond(202, self.write_result(new, old, params))
+            case "DELETE":
+                old = self.store.delete(name, key)
+                return self.respond(202, {"_id": old["_id"], "_key": key})
+        raise StoreError("method not supported", 405, 405)
+
+
+class MemoryDatabaseManager(DatabaseManager):
+    """
+    A DatabaseManager backed by MemoryStore instead of a live ArangoDB server.
+    """
+
+    def __init__(self, base_url: str, dbname: str, *args, **kwargs):
+        super().__init__(base_url, dbname, *args, **kwargs)
+        self.store = MemoryStore()
+        transport = MemoryTransport(self.store, dbname)
+        self.client = httpx.AsyncClient(base_url=base_url, transport=transport)
+        self.dbclient = httpx.AsyncClient(
+            base_url=f"{base_url}/_db/{dbname}", transport=transport
+        )
@@ -1,22 +1,136 @@
 import origin
+from origin.utils import tiles
+from origin.utils.grid import SpatialIndex, SpatialIndexCache, cell_key
+from origin.utils.pathfinding import WalkGrid
+from origin.utils.tiles import TileLayer
 from .core import DocumentProxy, CollectionManager
 
 
 class ObjectManager(CollectionManager):
     name = "object"
     proxy = "object"
+    lowercase_fields = {"name": "name_lower"}
+    indexes = [
+        {"type": "persistent", "fields": ["name_lower", "proxy"], "sparse": True},
+        {"type": "persistent", "fields": ["user"], "sparse": True},
+        {"type": "persistent", "fields": ["keyword_prefixes[*]"], "sparse": True},
+    ]
+
+    # Every keyword is stored in keyword_prefixes along with its prefixes up to this
+    # length, so that an array index can answer prefix searches with equality lookups.
+    # Longer search terms are looked up by their first keyword_prefix_length
+    # characters, then checked in full.
+    keyword_prefix_length = 8
 
     async def find_player(self, name: str):
         async for doc in self.dbmanager.query_proxy(
             """
-            FOR doc IN object 
-            FILTER LOWER(doc.name) == @name && doc.proxy == "player"
+            FOR doc IN object
+            FILTER doc.name_lower == @name && doc.proxy == "player"
             RETURN doc
             """,
             name=name.strip().lower(),
         ):
             return doc
 
+    def search_keywords(self, data: dict) -> list[str] | None:
+        """
+        The keywords a world search finds a Document by, from the fields set in data,
+        or None if data doesn't change them. These match get_appearance's keywords
+        when its hooks aren't overridden.
+        """
+        if "name" not in data:
+            return None
+        if not isinstance(name := data["name"], str):
+            return []
+        return name.lower().split()
+
+    def keyword_prefixes(self, keywords: list[str]) -> list[str]:
+        out = set()
+        for keyword in keywords:
+            out.add(keyword)
+            for length in range(1, min(len(keyword), self.keyword_prefix_length) + 1):
+                out.add(keyword[:length])
+        return sorted(out)
+
+    def normalize(self, data: dict) -> dict:
+        data = super().normalize(data)
+        if (keywords := self.search_keywords(data)) is not None:
+            data = dict(data)
+            data["keyword_prefixes"] = self.keyword_prefixes(keywords) or None
+        return data
+
+    async def create_supplemental(self):
+        await super().create_supplemental()
+        await self.backfill_keywords()
+
+    async def backfill_keywords(self):
+        """
+        Populate keyword_prefixes for Documents written before it existed.
+        """
+        patches = list()
+        async for doc in self.dbmanager.query("""
+            FOR doc IN object
+            FILTER doc.keyword_prefixes == null && IS_STRING(doc.name)
+            RETURN KEEP(doc, "_key", "name")
+            """):
+            data = self.normalize({"name": doc["name"]})
+            patches.append({"key": doc["_key"], "data": data})
+        for i in range(0, len(patches), 1000):
+            async for id in self.dbmanager.query(
+                """
+                FOR p IN @patches
+                UPDATE p.key WITH p.data IN object
+                RETURN NEW._id
+                """,
+                patches=patches[i : i + 1000],
+            ):
+                self.dbmanager.cache.discard(id)
+
+    async def search_keyword_ids(
+        self, text: str, exclude: str = None, count: int = 100, after: str = None
+    ) -> tuple[list[str], str | None]:
+        """
+        One page of the IDs of Objects with a keyword starting with text, or of all
+        Objects if text is empty, in _key order. Returns the page and the cursor to
+        pass as after for the next one, which is None after the last page.
+        """
+        text = text.lower()
+        filters = list()
+        bind_vars = {"count": count}
+        if text:
+            filters.append("FILTER @prefix IN doc.keyword_prefixes")
+            bind_vars["prefix"] = text[: self.keyword_prefix_length]
+        if len(text) > self.keyword_prefix_length:
+            filters.append("""
+                FILTER LENGTH((
+                    FOR k IN doc.keyword_prefixes
+                    FILTER STARTS_WITH(k, @text) LIMIT 1 RETURN k
+                )) > 0
+                """)
+            bind_vars["text"] = text
+        if exclude:
+            filters.append("FILTER doc._id != @exclude")
+            bind_vars["exclude"] = exclude
+        if after is not None:
+            filters.append("FILTER doc._key > @after")
+            bind_vars["after"] = after
+        found = [
+            key
+            async for key in self.dbmanager.query(
+                f"""
+                FOR doc IN object
+                {" ".join(filters)}
+                SORT doc._key
+                LIMIT @count
+                RETURN doc._key
+                """,
+                **bind_vars,
+            )
+        ]
+        ids = [f"{self.name}/{key}" for key in found]
+        return ids, (found[-1] if len(found) == count else None)
+
 
 class ObjectAppearance:
     __slots__ = [
@@ -39,17 +153,42 @@ class ObjectAppearance:
         self.pose = pose
 
 
+async def get_appearances(viewer, pairs) -> list[ObjectAppearance]:
+    """
+    Build appearances for (Object, document) pairs whose documents were already
+    retrieved together, so no Object needs a round trip of its own.
+    """
+    return [await obj.get_appearance(viewer, doc=doc) for obj, doc in pairs]
+
+
 class Object(DocumentProxy):
     location_proxy = "inventory_location"
 
+    # Fields which feed into get_appearance's keywords. Writing any of them updates
+    # the Object's entry in origin.CONTENTS_INDEX.
+    keyword_fields = ("name",)
+
+    async def patchDocument(self, data: dict, **kwargs):
+        await super().patchDocument(data, **kwargs)
+        if not self.keyword_fields or set(data).isdisjoint(self.keyword_fields):
+            return
+        if origin.CONTENTS_INDEX is not None:
+            await origin.CONTENTS_INDEX.changed(self)
+
+    async def putDocument(self, data, **kwargs):
+        await super().putDocument(data, **kwargs)
+        if origin.CONTENTS_INDEX is not None:
+            await origin.CONTENTS_INDEX.changed(self)
+
     async def weight(self) -> float:
         return 0.0
 
     async def volume(self) -> float:
         return 0.0
 
-    async def get_appearance(self, viewer) -> ObjectAppearance:
-        doc = await self.getDocument()
+    async def get_appearance(self, viewer, doc=None) -> ObjectAppearance:
+        if doc is None:
+            doc = await self.getDocument()
         name = doc.get("name", None)
         display_name = await self._generate_display_name(viewer, doc)
         prefix = await self._generate_display_prefix(viewer, doc)
@@ -104,10 +243,16 @@ class Object(DocumentProxy):
             text, args = text.split(" ", 1)
         else:
             args = ""
-        async for cmd in self.available_commands():
-            if res := await cmd.match(self, text):
-                command = cmd(self, orig_text, res, args)
-                await command.run()
+        table = await self.command_table()
+        if match := await table.match(self, text):
+            cmd, key = match
+            command = cmd(self, orig_text, key, args)
+            await command.run()
+
+    async def command_table(self) -> "CommandTable":
+        return await origin.COMMAND_DISPATCHER.table(
+            self, await self.get_proxy("location")
+        )
 
     async def available_commands(self):
         for cmd in await self.sorted_commands():
@@ -131,7 +276,7 @@ class Object(DocumentProxy):
         if loc := await self.get_proxy("location"):
             out.extend(await loc.get_commands(self))
 
-        return list(set(out))
+        return list(dict.fromkeys(out))
 
     async def can_detect(self, obj: "Object") -> bool:
         return True
@@ -156,14 +301,15 @@ class Object(DocumentProxy):
         }
         data.update(kwargs)
         if loc := await obj.get_proxy("location"):
-            await obj.putDocument(data=data)
-            await loc.change_proxy(proxy, save=False)
-            return loc
+            await loc.putDocument(data=data)
+            await loc.change_proxy(data["proxy"], save=False)
         else:
             locmgr = self.dbmanager.managers["location"]
             loc = await locmgr.create_document(data=data)
             await obj.set_field("location", loc)
-            return loc
+        if origin.CONTENTS_INDEX is not None:
+            await origin.CONTENTS_INDEX.added(self.id, data["proxy"], obj)
+        return loc
 
     async def add_to_inventory(self, obj: "Object", **kwargs):
         return await self.add_object_location(obj, "inventory_location", **kwargs)
@@ -175,6 +321,8 @@ class Object(DocumentProxy):
         if loc := await self.get_proxy("location"):
             await loc.deleteDocument()
             await self.set_field("location")
+            if origin.CONTENTS_INDEX is not None:
+                origin.CONTENTS_INDEX.removed(self.id)
 
     async def send_text(self, text: str):
         await self.send_event("Text", {"data": text})
@@ -189,25 +337,56 @@ class Object(DocumentProxy):
         return self.dbmanager.query_proxy(
             """
             FOR doc IN location
-            FILTER doc._from == @obj && doc.proxy == @proxy
-            return DOCUMENT(doc._to)
+            FILTER doc._to == @obj && doc.proxy == @proxy
+            return DOCUMENT(doc._from)
             """,
             obj=self.id,
             proxy=proxy,
         )
 
+    async def _contents_ids_helper(self, proxy: str) -> list[str]:
+        return [
+            id
+            async for id in self.dbmanager.query(
+                """
+                FOR doc IN location
+                FILTER doc._to == @obj && doc.proxy == @proxy
+                RETURN doc._from
+                """,
+                obj=self.id,
+                proxy=proxy,
+            )
+        ]
+
     async def inventory(self):
         async for doc in self._contents_helper("inventory_location"):
             yield doc
 
+    async def inventory_ids(self) -> list[str]:
+        return await self._contents_ids_helper("inventory_location")
+
     async def equipment(self):
         async for doc in self._contents_helper("equipment_location"):
             yield doc
 
+    async def equipment_ids(self) -> list[str]:
+        return await self._contents_ids_helper("equipment_location")
+
     async def contents(self):
         async for doc in self._contents_helper(self.location_proxy):
             yield doc
 
+    async def search_contents_ids(self, proxy: str, text: str) -> list[str]:
+        """
+        The IDs of contents held by proxy which have a keyword starting with text.
+        """
+        if origin.CONTENTS_INDEX is None:
+            return await self._contents_ids_helper(proxy)
+        return await origin.CONTENTS_INDEX.search(self, proxy, text)
+
+    async def contents_ids(self) -> list[str]:
+        return await self._contents_ids_helper(self.location_proxy)
+
     async def neighbors(self):
         if loc := await self.get_proxy("location"):
             async for doc in loc.get_neighbors(self):
@@ -217,18 +396,24 @@ class Object(DocumentProxy):
             # yes it's unreachable, no dont' remove it.
             yield
 
+    async def neighbor_ids(self) -> list[str]:
+        if loc := await self.get_proxy("location"):
+            return await loc.get_neighbor_ids(self)
+        return []
+
+    async def search_neighbor_ids(self, text: str) -> list[str]:
+        if loc := await self.get_proxy("location"):
+            return await loc.search_neighbor_ids(self, text)
+        return []
+
     async def render_appearance(self, obj):
         pass
 
     async def queue_command(self, command: str):
-        pending = await self.get_field("pending_commands", list())
-        pending.append(command)
-        await self.set_field("pending_commands", pending)
+        await origin.COMMAND_QUEUE.push(self, [command])
 
     async def queue_commands(self, commands: list[str]):
-        pending = await self.get_field("pending_commands", list())
-        pending.extend(commands)
-        await self.set_field("pending_commands", pending)
+        await origin.COMMAND_QUEUE.push(self, commands)
 
 
 class _Character(Object):
@@ -245,24 +430,208 @@ class NPC(_Character):
 
 class Grid(Object):
     location_proxy = "grid_location"
+    project_fields = True
+
+    # Shared by every Grid and grid chunk; see spatial_index().
+    spatial_indexes = SpatialIndexCache()
+    # Shared by every Grid with a dense TileLayer; see tile_layer().
+    tile_layers = SpatialIndexCache()
+
+    async def spatial_index(self, rev: str = None) -> SpatialIndex:
+        """
+        The SpatialIndex of the features stored in this Grid's Document, rebuilt
+        only when its _rev changes. Pass rev if it is already known to skip looking
+        it up.
+        """
+        if rev is None:
+            rev = await self.get_field("_rev")
+        if (index := self.spatial_indexes.get(self.id, rev)) is not None:
+            return index
+        data = await self.get_fields(["_rev", "grid"])
+        grid = data["grid"] or dict()
+        index = SpatialIndex(grid.get("features", None))
+        self.spatial_indexes.store(self.id, data["_rev"], index)
+        return index
+
+    async def chunk_indexes(
+        self, chunk_size: int, min_x: int, min_y: int, max_x: int, max_y: int
+    ) -> list[SpatialIndex]:
+        """
+        The SpatialIndex of every chunk overlapping an area, fetching only those not
+        already indexed at their current _rev. Chunks which don't exist yet are
+        remembered as empty.
+        """
+        chunks = self.dbmanager.managers["grid_chunk"]
+        cache = self.dbmanager.cache
+        ids = [
+            chunks.chunk_id(self.id, cx, cy)
+            for cy in range(min_y // chunk_size, (max_y - 1) // chunk_size + 1)
+            for cx in range(min_x // chunk_size, (max_x - 1) // chunk_size + 1)
+        ]
+        indexes = list()
+        fetch = list()
+        for id in ids:
+            rev = cache.revision(id)
+            if (index := self.spatial_indexes.get(id, rev)) is not None:
+                indexes.append(index)
+            else:
+                fetch.append(id)
+        if fetch:
+            found = {
+                doc["_id"]: doc
+                for doc in await self.dbmanager.getDocuments(fetch, proxy=False)
+            }
+            for id in fetch:
+                if doc := found.get(id, None):
+                    index = SpatialIndex.from_cells(doc.get("features", None))
+                    self.spatial_indexes.store(id, doc["_rev"], index)
+                else:
+                    index = SpatialIndex(())
+                    self.spatial_indexes.store(id, None, index)
+                indexes.append(index)
+        return indexes
 
     async def get_surroundings(
-        self, start: tuple[int, int], abs_x: int = 5, abs_y: int = 7, doc=None
+        self, start: tuple[int, int], abs_x: int = 5, abs_y: int = 7
     ):
-        if doc is None:
-            doc = await self.getDocument()
-
         start_x, start_y = start
         max_x = start_x + abs(abs_x)
         min_x = start_x - abs(abs_x)
         max_y = start_y + abs(abs_y)
         min_y = start_y - abs(abs_y)
+        if max_x <= min_x or max_y <= min_y:
+            return []
 
-        surroundings = []
+        info = await self.get_fields(["_rev", "grid_chunk_size", "has_tile_layer"])
+        if not (chunk_size := info["grid_chunk_size"]):
+            index = await self.spatial_index(rev=info["_rev"])
+            surroundings = index.viewport(min_x, min_y, max_x, max_y)
+        else:
+            surroundings = list()
+            indexes = await self.chunk_indexes(chunk_size, min_x, min_y, max_x, max_y)
+            for index in indexes:
+                surroundings.extend(index.viewport(min_x, min_y, max_x, max_y))
+
+        if info["has_tile_layer"] and (layer := await self.tile_layer(info["_rev"])):
+            # Features override the tile layer where both have a cell.
+            cells = dict(layer.features(min_x, min_y, max_x, max_y))
+            cells.update(surroundings)
+            surroundings = list(cells.items())
+        elif not chunk_size:
+            return surroundings
+
+        surroundings.sort(key=lambda f: (f[0][1], f[0][0]))
+        return surroundings
 
-        for coordinates, data in doc.get("features", []):
-            x, y = coordinates
-            if min_x <= x < max_x and min_y <= y < max_y:
-                surroundings.append((coordinates, data))
+    async def walkability(self) -> WalkGrid:
+        """
+        A fresh WalkGrid of this Grid, for pathfinding. Every chunk of a chunked Grid
+        is loaded for it, so use origin.PATHFINDER, which caches them.
+        """
+        info = await self.get_fields(["grid", "grid_chunk_size", "has_tile_layer"])
+        grid = info["grid"] or dict()
+        layer = await self.tile_layer() if info["has_tile_layer"] else None
+        if info["grid_chunk_size"]:
+            features = [
+                feature
+                async for cells in self.dbmanager.query(
+                    "FOR c IN grid_chunk FILTER c.grid == @grid RETURN c.features",
+                    grid=self.id,
+                )
+                for feature in SpatialIndex.from_cells(cells).cells.items()
+            ]
+        else:
+            features = grid.get("features", None)
+        bounds = None
+        if all(k in grid for k in ("min_x", "min_y", "max_x", "max_y")):
+            bounds = (grid["min_x"], grid["min_y"], grid["max_x"], grid["max_y"])
+        return WalkGrid.build(
+            bounds, grid.get("default_tile", "Void"), features=features, layer=layer
+        )
 
-        return surroundings
+    async def find_path(
+        self, start: tuple[int, int], goal: tuple[int, int]
+    ) -> list[tuple[int, int]] | None:
+        return await origin.PATHFINDER.find_path(self, start, goal)
+
+    async def tile_layer(self, rev: str = None) -> TileLayer | None:
+        """
+        This Grid's dense TileLayer, decoded once per _rev of its Document. None if
+        it has none, or NumPy isn't installed.
+        """
+        if tiles.np is None:
+            return None
+        if rev is None:
+            rev = await self.get_field("_rev")
+        if (layer := self.tile_layers.get(self.id, rev)) is not None:
+            return layer or None
+        data = await self.get_fields(["_rev", "tile_layer"])
+        # False marks a Grid with no layer, so that isn't looked up again.
+        layer = TileLayer.decode(data["tile_layer"]) if data["tile_layer"] else False
+        self.tile_layers.store(self.id, data["_rev"], layer)
+        return layer or None
+
+    async def save_tile_layer(self, layer: TileLayer | None):
+        """
+        Store layer as this Grid's TileLayer, or remove it with None.
+        """
+        if layer is None:
+            data = {"tile_layer": None, "has_tile_layer": None}
+        else:
+            data = {"tile_layer": layer.encode(), "has_tile_layer": True}
+        await self.patchDocument(data, params={"keepNull": "false"})
+        self.tile_layers.discard(self.id)
+
+    async def build_tile_layer(self) -> TileLayer:
+        """
+        Create and save a TileLayer over the bounds in this Grid's grid settings,
+        holding the tiles of its features within them. The features are kept.
+        """
+        grid = await self.get_field("grid") or dict()
+        layer = TileLayer.blank(
+            grid.get("min_x", 0),
+            grid.get("min_y", 0),
+            grid.get("max_x", 0),
+            grid.get("max_y", 0),
+            grid.get("default_tile", "Void"),
+        )
+        features = await self.get_surroundings(
+            (0, 0),
+            max(abs(layer.min_x), abs(layer.max_x)) + 1,
+            max(abs(layer.min_y), abs(layer.max_y)) + 1,
+        )
+        for (x, y), data in features:
+            if layer.contains(x, y) and (tile := data.get("tile", None)):
+                layer.set(x, y, tile)
+        await self.save_tile_layer(layer)
+        return layer
+
+    async def set_feature(self, x: int, y: int, data: dict | None):
+        """
+        Set or, with None, remove the feature at (x, y).
+        """
+        if chunk_size := await self.get_field("grid_chunk_size"):
+            chunks = self.dbmanager.managers["grid_chunk"]
+            cx, cy = x // chunk_size, y // chunk_size
+            id = chunks.chunk_id(self.id, cx, cy)
+            try:
+                await self.dbmanager.getDocument(id, proxy=False)
+            except self.dbmanager.DatabaseException:
+                chunk = {"grid": self.id, "x": cx, "y": cy, "features": dict()}
+                await chunks.create_document(chunk, key=id.split("/", 1)[1])
+            await self.dbmanager.patchDocument(
+                id,
+                {"features": {cell_key(x, y): data}},
+                params={"keepNull": "false"},
+            )
+            self.spatial_indexes.discard(id)
+            # Chunk writes don't change this Grid's _rev, which paths are keyed on.
+            if origin.PATHFINDER is not None:
+                origin.PATHFINDER.invalidate(self.id)
+            return
+
+        grid = await self.get_field("grid") or dict()
+        features = [f for f in grid.get("features", None) or [] if f[0] != [x, y]]
+        if data is not None:
+            features.append([[x, y], data])
+        await self.patchDocument({"grid": {"features": features}})
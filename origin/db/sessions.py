@@ -7,9 +7,28 @@ from .core import DocumentProxy, CollectionManager
 class SessionManager(CollectionManager):
     name = "session"
     proxy = "session"
+    indexes = [
+        {"type": "persistent", "fields": ["user"], "sparse": True},
+        {"type": "persistent", "fields": ["playview"], "sparse": True},
+    ]
+
+
+class InputJournalManager(CollectionManager):
+    """
+    An optional record of session input, written in batches by the server when
+    SESSION_INPUT_JOURNAL is enabled. Entries expire after a day.
+    """
+
+    name = "input_journal"
+    indexes = [
+        {"type": "ttl", "fields": ["timestamp"], "expireAfter": 86400},
+        {"type": "persistent", "fields": ["session", "timestamp"]},
+    ]
 
 
 class Session(DocumentProxy):
+    project_fields = True
+
     @lazy_property
     def sid(self):
         return self.id.split("/", 1)[1]
@@ -22,9 +41,7 @@ class Session(DocumentProxy):
         pass
 
     async def handle_event(self, event: str, message):
-        sess_input = await self.get_field("input", default=list())
-        sess_input.append([event, message])
-        await self.set_field("input", sess_input)
+        await self.execute_event(event, message)
 
     async def start(self):
         await origin.PARSERS["login"].start(self)
@@ -1,3 +1,8 @@
+import asyncio
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
 import origin
 from passlib.context import CryptContext
 from .core import CollectionManager, DocumentProxy
@@ -5,13 +10,146 @@ from .core import CollectionManager, DocumentProxy
 CRYPT_CONTEXT = CryptContext(schemes=["argon2"], deprecated="auto")
 
 
+def hash_password(password: str) -> str:
+    return CRYPT_CONTEXT.hash(password)
+
+
+def verify_password(password: str, password_hash: str) -> bool:
+    return CRYPT_CONTEXT.verify(password, password_hash)
+
+
+class HasherBusy(Exception):
+    """
+    Raised when too many password operations are already waiting.
+    """
+
+
+class PasswordHasher:
+    """
+    Runs argon2 hashing and verification off the event loop.
+
+    At most workers operations run at once, in a process pool (or a thread pool, as
+    argon2 releases the GIL). Up to max_pending more may wait for a worker; beyond
+    that, requests are rejected with HasherBusy rather than stalling logins further.
+    An executor of "inline" runs them directly on the loop, for scripts and tests.
+    """
+
+    def __init__(
+        self, executor: str = "process", workers: int = 0, max_pending: int = 32
+    ):
+        self.executor_type = executor
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        self.max_pending = max_pending
+        self.executor: Executor | None = None
+        self.semaphore = asyncio.Semaphore(self.workers)
+        self.pending = 0
+        self.running = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.max_pending_seen = 0
+        self.wait_time = 0.0
+        self.run_time = 0.0
+
+    def start(self):
+        if self.executor is not None:
+            return
+        match self.executor_type:
+            case "process":
+                self.executor = ProcessPoolExecutor(max_workers=self.workers)
+            case "thread":
+                self.executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="password_hasher"
+                )
+            case "inline":
+                pass
+            case _:
+                raise ValueError(
+                    f"Unknown password hasher executor {self.executor_type}"
+                )
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    async def run(self, func, *args):
+        if self.pending >= self.workers + self.max_pending:
+            self.rejected += 1
+            raise HasherBusy("The server is busy. Please try again in a moment.")
+        self.start()
+        self.pending += 1
+        self.submitted += 1
+        self.max_pending_seen = max(self.max_pending_seen, self.pending)
+        queued = time.perf_counter()
+        try:
+            async with self.semaphore:
+                started = time.perf_counter()
+                self.wait_time += started - queued
+                self.running += 1
+                try:
+                    if self.executor is None:
+                        result = func(*args)
+                    else:
+                        loop = asyncio.get_running_loop()
+                        result = await loop.run_in_executor(self.executor, func, *args)
+                except Exception:
+                    self.failed += 1
+                    raise
+                finally:
+                    self.running -= 1
+                    self.run_time += time.perf_counter() - started
+                self.completed += 1
+                return result
+        finally:
+            self.pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self.run(hash_password, password)
+
+    async def verify(self, password: str, password_hash: str) -> bool:
+        return await self.run(verify_password, password, password_hash)
+
+    def stats(self) -> dict:
+        done = self.completed + self.failed
+        return {
+            "executor": self.executor_type,
+            "workers": self.workers,
+            "running": self.running,
+            "waiting": self.pending - self.running,
+            "max_pending_seen": self.max_pending_seen,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "average_wait": self.wait_time / done if done else 0.0,
+            "average_run": self.run_time / done if done else 0.0,
+        }
+
+
+def password_hasher() -> PasswordHasher:
+    if origin.PASSWORD_HASHER is None:
+        origin.PASSWORD_HASHER = PasswordHasher()
+    return origin.PASSWORD_HASHER
+
+
 class UserManager(CollectionManager):
     name = "user"
     proxy = "user"
+    lowercase_fields = {"username": "username_lower"}
+    indexes = [
+        {
+            "type": "persistent",
+            "fields": ["username_lower"],
+            "unique": True,
+            "sparse": True,
+        },
+    ]
 
     async def find_user(self, username: str):
         async for doc in self.dbmanager.query_proxy(
-            "FOR doc IN user FILTER LOWER(doc.username) == @username RETURN doc",
+            "FOR doc IN user FILTER doc.username_lower == @username RETURN doc",
             username=username.lower(),
         ):
             return doc
@@ -20,7 +158,7 @@ class UserManager(CollectionManager):
         if await self.find_user(username):
             raise ValueError(f"User {username} already exists.")
         try:
-            password_hash = CRYPT_CONTEXT.hash(password)
+            password_hash = await password_hasher().hash(password)
         except (TypeError, ValueError):
             raise ValueError(f"Non-hashable password, try another.")
         data = {"username": username, "password_hash": password_hash}
@@ -48,16 +186,15 @@ class User(DocumentProxy):
             yield doc
 
     async def authenticate(self, password: str) -> bool:
-        doc = await self.getDocument()
-        if not (password_hash := doc.get("password_hash", None)):
+        if not (password_hash := await self.get_field("password_hash")):
             return False
-        return CRYPT_CONTEXT.verify(password, password_hash)
+        return await password_hasher().verify(password, password_hash)
 
     async def set_password(self, password: str):
-        data = {"password_hash": CRYPT_CONTEXT.hash(password) if password else None}
+        password_hash = await password_hasher().hash(password) if password else None
+        data = {"password_hash": password_hash}
         params = {"keepNull": "false"}
         await self.patchDocument(data, params=params)
 
     async def level(self) -> int:
-        doc = await self.getDocument()
-        return doc.get("level", 0)
+        return await self.get_field("level", 0)
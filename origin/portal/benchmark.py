@@ -0,0 +1,234 @@
+"""
+Throughput benchmarks for the portal's telnet handling, which needs no network or
+game server. Run with:
+
+    python -m origin.portal.benchmark [--megabytes N] [--read-size N ...]
+    python -m origin.portal.benchmark --compression [--level N ...]
+"""
+
+import argparse
+import random
+import time
+import zlib
+
+from .telnet import (
+    TelnetCode,
+    TelnetCommand,
+    TelnetData,
+    TelnetNegotiate,
+    TelnetParser,
+    TelnetSubNegotiate,
+)
+
+
+def sample_stream(megabytes: float, seed: int = 0) -> bytes:
+    """
+    A telnet stream of roughly the given size, resembling client input: mostly
+    lines of text, with some escaped IACs, GMCP and NAWS subnegotiations and the
+    odd negotiation mixed in.
+    """
+    rng = random.Random(seed)
+    words = [b"look", b"say", b"get", b"sword", b"north", b"hello", b"there", b"all"]
+    iac = bytes([TelnetCode.IAC])
+    out = bytearray()
+    target = int(megabytes * 1024 * 1024)
+    while len(out) < target:
+        roll = rng.random()
+        if roll < 0.80:
+            line = b" ".join(rng.choice(words) for _ in range(rng.randint(1, 16)))
+            if rng.random() < 0.02:
+                line += iac + iac
+            out.extend(line + b"\r\n")
+        elif roll < 0.95:
+            payload = b'Core.Hello {"client": "Mudlet", "version": "4.17.2"}'
+            out.extend(
+                bytes([TelnetCode.IAC, TelnetCode.SB, TelnetCode.GMCP])
+                + payload
+                + bytes([TelnetCode.IAC, TelnetCode.SE])
+            )
+        elif roll < 0.99:
+            out.extend(
+                bytes([TelnetCode.IAC, TelnetCode.SB, TelnetCode.NAWS, 0, 80, 0, 24])
+                + bytes([TelnetCode.IAC, TelnetCode.SE])
+            )
+        else:
+            out.extend(bytes([TelnetCode.IAC, TelnetCode.WILL, TelnetCode.NAWS]))
+    return bytes(out)
+
+
+def sample_output(megabytes: float, seed: int = 0) -> list[bytes]:
+    """
+    Writes resembling game output: colored room descriptions, combat messages and
+    prompts, each as it would be handed to the telnet writer.
+    """
+    rng = random.Random(seed)
+    words = [b"the", b"dark", b"forest", b"path", b"goblin", b"strikes", b"you", b"old"]
+    colors = [b"\x1b[0;36m", b"\x1b[0;32m", b"\x1b[1;33m", b"\x1b[0m"]
+    out = list()
+    size = 0
+    target = int(megabytes * 1024 * 1024)
+    while size < target:
+        lines = rng.choice([1, 1, 2, 12])
+        chunk = b"".join(
+            rng.choice(colors)
+            + b" ".join(rng.choice(words) for _ in range(rng.randint(4, 14)))
+            + b"\r\n"
+            for _ in range(lines)
+        )
+        chunk += b"<100hp 50m 80mv> "
+        out.append(chunk)
+        size += len(chunk)
+    return out
+
+
+def measure_compression(
+    writes: list[bytes], level: int, wbits: int = 15, memlevel: int = 8
+) -> tuple[float, float]:
+    """
+    Compress writes as MCCP2 does, with a sync flush after each. Returns the
+    throughput in MB/s and the compressed size as a fraction of the original.
+    """
+    compress = zlib.compressobj(level, zlib.DEFLATED, wbits, memlevel)
+    total_in = total_out = 0
+    started = time.perf_counter()
+    for data in writes:
+        total_in += len(data)
+        total_out += len(compress.compress(data))
+        total_out += len(compress.flush(zlib.Z_SYNC_FLUSH))
+    elapsed = time.perf_counter() - started
+    return total_in / (1024 * 1024) / elapsed, total_out / total_in
+
+
+# The parser as it was before TelnetParser, kept here as the baseline: it scans for
+# IAC a byte at a time and parses one message per call.
+
+
+def legacy_scan_until_IAC(data: bytes) -> int:
+    for i in range(len(data)):
+        if data[i] == TelnetCode.IAC:
+            return i
+    return len(data)
+
+
+def legacy_scan_until_IAC_SE(data: bytes) -> int:
+    i = 0
+    while i < len(data) - 1:
+        if data[i] == TelnetCode.IAC:
+            if data[i + 1] == TelnetCode.SE:
+                return i + 2
+            elif data[i + 1] == TelnetCode.IAC:
+                i += 2
+                continue
+        i += 1
+    return -1
+
+
+def legacy_parse_telnet(data: bytes) -> tuple[int, object]:
+    if len(data) < 1:
+        return 0, None
+
+    if data[0] == TelnetCode.IAC:
+        if len(data) < 2:
+            return 0, None
+
+        if data[1] == TelnetCode.IAC:
+            return 2, TelnetData(data[:1])
+        elif data[1] in (
+            TelnetCode.WILL,
+            TelnetCode.WONT,
+            TelnetCode.DO,
+            TelnetCode.DONT,
+        ):
+            if len(data) < 3:
+                return 0, None
+            return 3, TelnetNegotiate(data[1], data[2])
+        elif data[1] == TelnetCode.SB:
+            length = legacy_scan_until_IAC_SE(data)
+            if length < 5:
+                return 0, None
+            return length, TelnetSubNegotiate(data[2], data[3 : length - 2])
+        else:
+            return 2, TelnetCommand(data[1])
+
+    length = legacy_scan_until_IAC(data)
+    return length, TelnetData(data[:length])
+
+
+def parse_legacy(stream: bytes, read_size: int) -> int:
+    """
+    The message-at-a-time approach: legacy_parse_telnet() on the buffer, deleting
+    each message's bytes from the front of it.
+    """
+    buffer = bytearray()
+    count = 0
+    for i in range(0, len(stream), read_size):
+        buffer.extend(stream[i : i + read_size])
+        while True:
+            length, message = legacy_parse_telnet(buffer)
+            if message is None:
+                break
+            del buffer[:length]
+            count += 1
+    return count
+
+
+def parse_incremental(stream: bytes, read_size: int) -> int:
+    parser = TelnetParser()
+    count = 0
+    for i in range(0, len(stream), read_size):
+        count += len(parser.feed(stream[i : i + read_size]))
+    return count
+
+
+def measure(func, stream: bytes, read_size: int) -> tuple[float, int]:
+    """
+    Returns func's throughput in MB/s and how many messages it produced.
+    """
+    started = time.perf_counter()
+    count = func(stream, read_size)
+    elapsed = time.perf_counter() - started
+    return len(stream) / (1024 * 1024) / elapsed, count
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark telnet parsing and compression."
+    )
+    parser.add_argument("--megabytes", type=float, default=8.0)
+    parser.add_argument(
+        "--read-size", type=int, nargs="+", default=[1024, 16384, 262144]
+    )
+    parser.add_argument(
+        "--compression",
+        action="store_true",
+        help="Benchmark MCCP2 compression levels instead of parsing.",
+    )
+    parser.add_argument("--level", type=int, nargs="+", default=[1, 3, 6, 9])
+    parser.add_argument("--wbits", type=int, default=15)
+    parser.add_argument("--memlevel", type=int, default=8)
+    args = parser.parse_args()
+
+    if args.compression:
+        writes = sample_output(args.megabytes)
+        megabytes = sum(len(w) for w in writes) / (1024 * 1024)
+        print(f"Compressing {megabytes:.1f} MB of output in {len(writes)} writes.")
+        for level in args.level:
+            rate, ratio = measure_compression(writes, level, args.wbits, args.memlevel)
+            print(f"level {level}: {rate:8.1f} MB/s, {ratio:.1%} of original size")
+        return
+
+    stream = sample_stream(args.megabytes)
+    print(f"Parsing {len(stream) / (1024 * 1024):.1f} MB of telnet input.")
+    for read_size in args.read_size:
+        for name, func in (
+            ("legacy", parse_legacy),
+            ("TelnetParser", parse_incremental),
+        ):
+            rate, count = measure(func, stream, read_size)
+            print(
+                f"{name:>14}  read size {read_size:>7}: {rate:8.1f} MB/s, {count} messages"
+            )
+
+
+if __name__ == "__main__":
+    main()
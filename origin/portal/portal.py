@@ -28,6 +28,9 @@ class Service:
     async def start(self):
         pass
 
+    async def at_stop(self):
+        pass
+
 
 class Core:
     app = "portal"
@@ -5,8 +5,11 @@ import orjson
 import ssl
 import origin
 import logging
+import time
 import traceback
 
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field
 from enum import IntEnum
 
@@ -45,7 +48,7 @@ class TelnetCode(IntEnum):
 
     # Compression
     # MCCP1: u8 = 85 - this is deprecrated
-    # NOTE: MCCP2 and MCCP3 is currently disabled.
+    # MCCP2 and MCCP3 can be turned off with PORTAL_MCCP2 and PORTAL_MCCP3.
     MCCP2 = 86
     MCCP3 = 87
 
@@ -161,28 +164,26 @@ class TelnetSubNegotiate:
         return f"<TelnetSubNegotiate: {self}>"
 
 
-def scan_until_IAC(data: bytes) -> int:
-    for i in range(len(data)):
-        if data[i] == TelnetCode.IAC:  # 255 is the IAC byte
-            return i
-    return len(data)  # Return the length if IAC is not found
+def scan_until_IAC(data: bytes, start: int = 0) -> int:
+    found = data.find(b"\xff", start)
+    return len(data) if found == -1 else found
 
 
-def scan_until_IAC_SE(data: bytes) -> int:
-    i = 0
-    while i < len(data) - 1:  # -1 because we need at least 2 bytes for IAC SE
-        if data[i] == TelnetCode.IAC:
-            if data[i + 1] == TelnetCode.SE:
-                # Found unescaped IAC SE
-                return i + 2  # Return the length including IAC SE
-            elif data[i + 1] == TelnetCode.IAC:
-                # Escaped IAC, skip this and the next byte
+def scan_until_IAC_SE(data: bytes, start: int = 0) -> int:
+    """
+    Find the end of a subnegotiation, skipping escaped IACs. Returns the length up
+    to and including IAC SE, or -1 if it hasn't all arrived yet.
+    """
+    i = start
+    while (i := data.find(b"\xff", i)) != -1 and i + 1 < len(data):
+        match data[i + 1]:
+            case TelnetCode.SE:
+                return i + 2
+            case TelnetCode.IAC:
                 i += 2
-                continue
-            # Else it's an IAC followed by something other than SE or another IAC,
-            # which is unexpected in subnegotiation. Handle as needed.
-        i += 1
-    return -1  # Return -1 to indicate that IAC SE was not found
+            case _:
+                i += 1
+    return -1
 
 
 def parse_telnet(
@@ -227,6 +228,286 @@ def parse_telnet(
     return length, TelnetData(data[:length])
 
 
+_NEGOTIATE_COMMANDS = frozenset(
+    int(code)
+    for code in (TelnetCode.WILL, TelnetCode.WONT, TelnetCode.DO, TelnetCode.DONT)
+)
+
+
+class TelnetParser:
+    """
+    Parses a telnet stream incrementally, a read at a time.
+
+    feed() scans the buffered bytes from a moving offset, finding IACs with
+    bytearray.find rather than byte by byte, and returns every complete message at
+    once. The consumed bytes are dropped once per feed, not once per message, so a
+    large paste or a burst of GMCP costs time proportional to its size.
+
+    Consecutive data, including escaped IACs, is joined into a single TelnetData.
+    When a subnegotiation for an option in interrupt_options is parsed, parsing
+    stops there and the rest stays buffered, so that whatever handles it (such as
+    MCCP3 starting decompression) can change the remaining bytes via replace()
+    before feeding resumes.
+    """
+
+    def __init__(self, interrupt_options: typing.Iterable[int] = ()):
+        self.buffer = bytearray()
+        self.interrupt_options = set(interrupt_options)
+        # Where to resume looking for IAC SE in a subnegotiation which is still
+        # arriving, so a large one isn't rescanned from its start on every read.
+        self._resume = 0
+
+    def replace(self, data: bytes):
+        """
+        Replace the unparsed bytes.
+        """
+        self.buffer[:] = data
+        self._resume = 0
+
+    def feed(
+        self, data: bytes = b""
+    ) -> list[
+        typing.Union[TelnetCommand, TelnetData, TelnetNegotiate, TelnetSubNegotiate]
+    ]:
+        # Plain ints, as comparing against TelnetCode members is slow.
+        IAC, SB, SE = int(TelnetCode.IAC), int(TelnetCode.SB), int(TelnetCode.SE)
+        buf = self.buffer
+        buf.extend(data)
+        end = len(buf)
+        messages = list()
+        text = bytearray()
+        pos = 0
+
+        with memoryview(buf) as view:
+            while pos < end:
+                if buf[pos] != IAC:
+                    found = buf.find(b"\xff", pos)
+                    if found == -1:
+                        found = end
+                    text.extend(view[pos:found])
+                    pos = found
+                    continue
+
+                if pos + 1 >= end:
+                    break
+                command = buf[pos + 1]
+                if command == IAC:
+                    text.append(IAC)
+                    pos += 2
+                    continue
+
+                if command in _NEGOTIATE_COMMANDS:
+                    if pos + 2 >= end:
+                        break
+                    message = TelnetNegotiate(command, buf[pos + 2])
+                    length = 3
+                elif command == SB:
+                    i = pos + max(3, self._resume)
+                    while (i := buf.find(b"\xff", i)) != -1 and i + 1 < end:
+                        if buf[i + 1] == SE:
+                            break
+                        i += 2 if buf[i + 1] == IAC else 1
+                    else:
+                        # Not all here yet. Resume from the trailing IAC, if any.
+                        self._resume = (end if i == -1 else i) - pos
+                        break
+                    self._resume = 0
+                    length = i + 2
+                    payload = bytes(view[pos + 3 : length - 2])
+                    if b"\xff\xff" in payload:
+                        payload = payload.replace(b"\xff\xff", b"\xff")
+                    message = TelnetSubNegotiate(buf[pos + 2], payload)
+                    length -= pos
+                else:
+                    message = TelnetCommand(command)
+                    length = 2
+
+                if text:
+                    messages.append(TelnetData(bytes(text)))
+                    text.clear()
+                messages.append(message)
+                pos += length
+                if command == SB and message.option in self.interrupt_options:
+                    break
+
+        if text:
+            messages.append(TelnetData(bytes(text)))
+        if pos:
+            del buf[:pos]
+        return messages
+
+
+class LineAssembler:
+    """
+    Splits application data into lines.
+
+    feed() splits and decodes every complete line in the buffer in one pass,
+    then trims them from the buffer once. Lines longer than max_line_length
+    characters are truncated. A line still arriving which grows past
+    max_line_length bytes keeps only that many, and the rest of it is ignored. If
+    more than max_buffer bytes of lines arrive at once, the ones beyond that are
+    dropped.
+    """
+
+    def __init__(self, max_line_length: int = 4096, max_buffer: int = 65536):
+        self.buffer = bytearray()
+        self.max_line_length = max_line_length
+        self.max_buffer = max_buffer
+        # Whether the rest of an overlong line is being ignored.
+        self.discarding = False
+        self.truncated = 0
+        self.dropped = 0
+
+    def feed(self, data: bytes) -> list[str]:
+        buf = self.buffer
+        if self.discarding:
+            if (newline := data.find(b"\n")) == -1:
+                return list()
+            self.discarding = False
+            data = data[newline:]
+        buf.extend(data)
+
+        lines = list()
+        if end := buf.rfind(b"\n") + 1:
+            stop = end
+            if end > self.max_buffer:
+                stop = buf.rfind(b"\n", 0, self.max_buffer) + 1 or buf.find(b"\n") + 1
+                if dropped := buf.count(b"\n", stop, end):
+                    self.dropped += dropped
+                    logging.warning(f"Dropped {dropped} lines of input over the limit.")
+            text = buf[: stop - 1].decode("utf-8", errors="ignore")
+            max_length = self.max_line_length
+            for line in text.split("\n"):
+                line = line.rstrip("\r")
+                if len(line) > max_length:
+                    line = line[:max_length]
+                    self.truncated += 1
+                lines.append(line)
+            del buf[:end]
+
+        if len(buf) > self.max_line_length:
+            del buf[self.max_line_length :]
+            self.discarding = True
+        return lines
+
+
+class TelnetOutputQueue:
+    """
+    A FIFO queue of TelnetMessages waiting to be written, which tracks how many
+    bytes it holds so a client which stops reading can't make it grow without
+    limit. It offers the parts of asyncio.Queue's interface the writer uses, but
+    each message is serialized once, when it's queued, and get() returns it along
+    with its bytes.
+
+    Once more than soft_limit bytes are queued, low-priority output (GMCP) is held
+    back: a GMCP message replaces the queued one for the same package and command,
+    if any, by removing it and joining the back of the queue, and is otherwise
+    dropped. Any other output which would take it past hard_limit bytes calls
+    on_overflow, which should disconnect the client, and everything after that is
+    dropped.
+    """
+
+    low_priority_options = frozenset([int(TelnetCode.GMCP)])
+
+    def __init__(
+        self,
+        soft_limit: int = 262144,
+        hard_limit: int = 4194304,
+        on_overflow: typing.Callable[[], None] = None,
+    ):
+        self.soft_limit = soft_limit
+        self.hard_limit = hard_limit
+        self.on_overflow = on_overflow
+        self.bytes = 0
+        self.high_water = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.overflowed = False
+        # Entries are [message, bytes, coalescing key]. A coalesced entry is emptied
+        # in place and skipped when it reaches the front.
+        self._entries: deque[list] = deque()
+        self._count = 0
+        self._ready = asyncio.Event()
+        # Queued low-priority entries by their GMCP command, for coalescing.
+        self._coalesce: dict[bytes, list] = dict()
+
+    def qsize(self) -> int:
+        return self._count
+
+    def empty(self) -> bool:
+        return not self._count
+
+    def put_nowait(self, msg):
+        if self.overflowed:
+            self.dropped += 1
+            return
+        data = bytes(msg) if msg else b""
+        size = len(data)
+        key = None
+        if (
+            isinstance(msg, TelnetSubNegotiate)
+            and msg.option in self.low_priority_options
+        ):
+            key = bytes(msg.data).split(b" ", 1)[0]
+            if self.bytes + size > self.soft_limit:
+                if (queued := self._coalesce.get(key, None)) is None:
+                    self.dropped += 1
+                    return
+                self.bytes -= len(queued[1])
+                self._count -= 1
+                queued.clear()
+                self.coalesced += 1
+        elif msg and self.bytes + size > self.hard_limit:
+            self.overflowed = True
+            self.dropped += 1
+            if self.on_overflow:
+                self.on_overflow()
+            return
+        entry = [msg, data, key]
+        if key is not None:
+            self._coalesce[key] = entry
+        self._entries.append(entry)
+        self._count += 1
+        self.bytes += size
+        self.high_water = max(self.high_water, self.bytes)
+        self._ready.set()
+
+    async def put(self, msg):
+        self.put_nowait(msg)
+
+    def get_nowait(self) -> tuple[typing.Any, bytes]:
+        entries = self._entries
+        while entries:
+            entry = entries.popleft()
+            if not entry:
+                continue
+            msg, data, key = entry
+            if key is not None and self._coalesce.get(key, None) is entry:
+                del self._coalesce[key]
+            self._count -= 1
+            self.bytes -= len(data)
+            if not entries:
+                self._ready.clear()
+            return msg, data
+        self._ready.clear()
+        raise asyncio.QueueEmpty()
+
+    async def get(self) -> tuple[typing.Any, bytes]:
+        while True:
+            try:
+                return self.get_nowait()
+            except asyncio.QueueEmpty:
+                await self._ready.wait()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "bytes": self.bytes,
+            "high_water": self.high_water,
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+        }
+
+
 @dataclass
 class TelnetOptionState:
     enabled: bool = False
@@ -538,20 +819,55 @@ class MSSPOption(TelnetOption):
         await self.send_subnegotiate(out)
 
 
+@dataclass
+class CompressionStats:
+    bytes_in: int = 0
+    bytes_out: int = 0
+    cpu_time: float = 0.0
+
+    @property
+    def ratio(self) -> float:
+        """
+        Compressed size as a fraction of the original.
+        """
+        return self.bytes_out / self.bytes_in if self.bytes_in else 1.0
+
+
 class MCCP2Option(TelnetOption):
     code: TelnetCode = TelnetCode.MCCP2
     support_local: bool = True
     start_local: bool = True
 
+    def __init__(self, protocol):
+        super().__init__(protocol)
+        self.starting = False
+
+    async def start_compression(self):
+        """
+        Tell the client that everything after this is compressed. Called once the
+        connection has written server.mccp_min_output bytes, so short-lived ones
+        never pay for a compressor.
+        """
+        if not self.starting:
+            self.starting = True
+            await self.send_subnegotiate(b"")
+
     async def at_send_subnegotiate(self, msg):
         if not self.protocol.capabilities.mccp2_enabled:
             await self.protocol.change_capabilities({"mccp2_enabled": True})
-            self.protocol.compress_out = zlib.compressobj(9)
+            server = self.protocol.server
+            self.protocol.compress_out = zlib.compressobj(
+                server.mccp_level,
+                zlib.DEFLATED,
+                server.mccp_wbits,
+                server.mccp_memlevel,
+            )
 
     async def at_local_enable(self):
         await self.protocol.change_capabilities({"mccp2": True})
         self.negotiation.set()
-        await self.send_subnegotiate(b"")
+        if self.protocol.bytes_written >= self.protocol.server.mccp_min_output:
+            await self.start_compression()
 
 
 class MCCP3Option(TelnetOption):
@@ -563,12 +879,10 @@ class MCCP3Option(TelnetOption):
         if not self.protocol.capabilities.mccp3_enabled:
             await self.protocol.change_capabilities({"mccp3_enabled": True})
             self.protocol.decompress_in = zlib.decompressobj()
+            # Everything the client sent after this subnegotiation is compressed.
+            parser = self.protocol.telnet_parser
             try:
-                self.protocol._telnet_read_buffer = bytearray(
-                    self.protocol.decompress_in.decompress(
-                        self.protocol._telnet_read_buffer
-                    )
-                )
+                parser.replace(self.protocol.decompress_in.decompress(parser.buffer))
             except zlib.error as e:
                 pass  # todo: handle this
 
@@ -598,8 +912,7 @@ class GMCPOption(TelnetOption):
         to_send = bytearray()
         to_send.extend(command.encode())
         if data is not None:
-            gmcp_data = f" {orjson.dumps(data)}"
-            to_send.extend(gmcp_data.encode())
+            to_send.extend(b" " + orjson.dumps(data))
         await self.send_subnegotiate(to_send)
 
 
@@ -637,23 +950,55 @@ class TelnetProtocol(PortalSession):
         self.reader = reader
         self.writer = writer
         self.server = server
-        self._telnet_read_buffer = bytearray()
+        self.telnet_parser = TelnetParser(interrupt_options=[TelnetCode.MCCP3])
         self._telnet_in_queue = asyncio.Queue()
-        self._telnet_out_queue = asyncio.Queue()
-        self._app_data = bytearray()
+        self._telnet_out_queue = TelnetOutputQueue(
+            soft_limit=server.output_soft_limit,
+            hard_limit=server.output_hard_limit,
+            on_overflow=self.at_output_overflow,
+        )
+        # Bounded, so a client sending faster than the game takes its input is
+        # simply not read from until it catches up.
+        self.outgoing_queue = asyncio.Queue(maxsize=server.max_pending_input)
+        self.line_assembler = LineAssembler(
+            max_line_length=server.max_line_length, max_buffer=server.max_input_buffer
+        )
 
         self.telnet_options: dict[int, TelnetOption] = {}
         self.compress_out = None
         self.decompress_in = None
         self.remote_disconnect: bool = False
+        self.bytes_written = 0
+        self.compression = CompressionStats()
 
         for op in self.supported_options:
-            self.telnet_options[op.code] = op(self)
+            if op.code not in server.disabled_options:
+                self.telnet_options[op.code] = op(self)
 
     async def on_disconnect(self):
         self.remote_disconnect = True
         self.task_group._abort()
 
+    def at_output_overflow(self):
+        """
+        Called when the client has fallen too far behind on reading its output.
+        """
+        logging.warning(
+            f"{self!r} disconnected for not reading its output: {self.output_stats()}"
+        )
+        self.remote_disconnect = True
+        self.task_group._abort()
+
+    def output_stats(self) -> dict[str, int]:
+        """
+        How much output is waiting for this client, at most and now, and how much
+        was coalesced or dropped.
+        """
+        stats = self._telnet_out_queue.stats()
+        if transport := getattr(self.writer, "transport", None):
+            stats["transport_bytes"] = transport.get_write_buffer_size()
+        return stats
+
     async def run(self):
         async with self.task_group as tg:
             tg.create_task(self.run_reader())
@@ -690,20 +1035,18 @@ class TelnetProtocol(PortalSession):
                 if self.decompress_in.unused_data != b"":
                     op: MCCP3Option = self.telnet_options[TelnetCode.MCCP3]
                     await op.at_decompress_end()
-                self._telnet_read_buffer.extend(data)
             except zlib.error as e:
                 op: MCCP3Option = self.telnet_options[TelnetCode.MCCP3]
                 await op.at_decompress_end()
-        else:
-            self._telnet_read_buffer.extend(data)
+                return
 
-        while True:
-            length, message = parse_telnet(self._telnet_read_buffer)
-            if message is not None:
-                del self._telnet_read_buffer[:length]
+        messages = self.telnet_parser.feed(data)
+        while messages:
+            for message in messages:
                 await self.at_telnet_message(message)
-            else:
-                break
+            # The parser stops early after messages which change how the rest of
+            # the buffer must be read, so pick up where it left off.
+            messages = self.telnet_parser.feed()
 
     async def at_telnet_message(self, message):
         """
@@ -720,29 +1063,14 @@ class TelnetProtocol(PortalSession):
                 await self.handle_subnegotiate(message)
 
     async def handle_data(self, message: TelnetData):
-        self._app_data.extend(message.data)
-
-        # scan self._app_data for lines ending in \r\n...
-        while True:
-            # Find the position of the next newline character
-            newline_pos = self._app_data.find(b"\n")
-            if newline_pos == -1:
-                break  # No more newlines
-
-            # Extract the line, trimming \r\n at the end
-            line = (
-                self._app_data[:newline_pos]
-                .rstrip(b"\r\n")
-                .decode("utf-8", errors="ignore")
-            )
-
-            # Process the line
-            if line != "IDLE":
-                out_message = {"data": line}
-                await self.outgoing_queue.put(("Command", out_message))
-
-            # Remove the processed line from _app_data
-            self._app_data = self._app_data[newline_pos + 1 :]
+        lines = [
+            line for line in self.line_assembler.feed(message.data) if line != "IDLE"
+        ]
+        # Everything which arrived together goes to the game as one message.
+        if len(lines) == 1:
+            await self.outgoing_queue.put(("Command", {"data": lines[0]}))
+        elif lines:
+            await self.outgoing_queue.put(("Commands", {"data": lines}))
 
     async def handle_negotiate(self, message: TelnetNegotiate):
         if op := self.telnet_options.get(message.option, None):
@@ -766,27 +1094,117 @@ class TelnetProtocol(PortalSession):
         pass
 
     def encode_outgoing_data(self, msg) -> bytes:
-        if self.capabilities.mccp2_enabled:
-            return self.compress_out.compress(bytes(msg)) + self.compress_out.flush(
-                zlib.Z_SYNC_FLUSH
-            )
-        else:
-            return bytes(msg)
+        data = bytes(msg)
+        if not self.capabilities.mccp2_enabled:
+            return data
+        # thread_time, as this may run in the compression thread pool.
+        started = time.thread_time()
+        out = self.compress_out.compress(data) + self.compress_out.flush(
+            zlib.Z_SYNC_FLUSH
+        )
+        stats = self.compression
+        stats.cpu_time += time.thread_time() - started
+        stats.bytes_in += len(data)
+        stats.bytes_out += len(out)
+        return out
+
+    async def encode_outgoing(self, data: bytearray) -> bytes:
+        """
+        encode_outgoing_data(), moved to the server's compression thread pool if
+        there is one and data is large enough to be worth it.
+        """
+        executor = self.server.compression_executor
+        if (
+            executor
+            and self.capabilities.mccp2_enabled
+            and len(data) >= self.server.mccp_thread_min_size
+        ):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(executor, self.encode_outgoing_data, data)
+        return self.encode_outgoing_data(data)
+
+    def compression_stats(self) -> dict[str, float]:
+        stats = self.compression
+        return {
+            "bytes_in": stats.bytes_in,
+            "bytes_out": stats.bytes_out,
+            "ratio": stats.ratio,
+            "cpu_time": stats.cpu_time,
+        }
+
+    async def next_batch(self, first: tuple) -> tuple[list, bool]:
+        """
+        Gather the (message, bytes) pairs to write along with first: whatever else
+        is queued, up to about server.max_write_batch bytes, waiting up to
+        server.write_latency seconds for more if the queue runs dry. Returns them
+        and whether the queue was closed.
+        """
+        queue = self._telnet_out_queue
+        batch = [first]
+        size = len(first[1])
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.server.write_latency
+        while size < self.server.max_write_batch:
+            try:
+                entry = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                if (remaining := deadline - loop.time()) <= 0:
+                    break
+                try:
+                    entry = await asyncio.wait_for(queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+            if not entry[0]:
+                return batch, True
+            batch.append(entry)
+            size += len(entry[1])
+        return batch, False
+
+    async def write_batch(self, batch: list):
+        """
+        Encode a batch of (TelnetMessage, bytes) pairs into one buffer, compressed
+        with a single sync flush when MCCP2 is on, and write it at once.
+        """
+        out = bytearray()
+        pending = bytearray()
+        for msg, data in batch:
+            pending.extend(data)
+            match msg:
+                case TelnetNegotiate():
+                    op = self.telnet_options.get(msg.option, None)
+                    hook = op.at_send_negotiate if op else None
+                case TelnetSubNegotiate():
+                    op = self.telnet_options.get(msg.option, None)
+                    hook = op.at_send_subnegotiate if op else None
+                case _:
+                    continue
+            if hook:
+                # The hook may change how what follows is encoded, as when MCCP2
+                # starts compressing, so what precedes it is encoded first.
+                out.extend(await self.encode_outgoing(pending))
+                pending.clear()
+                await hook(msg)
+        if pending:
+            out.extend(await self.encode_outgoing(pending))
+        self.writer.write(out)
+        self.bytes_written += len(out)
+        await self.writer.drain()
+
+        if (
+            self.capabilities.mccp2
+            and not self.capabilities.mccp2_enabled
+            and self.bytes_written >= self.server.mccp_min_output
+        ):
+            op: MCCP2Option = self.telnet_options[TelnetCode.MCCP2]
+            await op.start_compression()
 
     async def run_writer(self):
         try:
-            while data := await self._telnet_out_queue.get():
-                # each data should be a TelnetMessage.
-                encoded = self.encode_outgoing_data(data)
-                self.writer.write(encoded)
-                match data:
-                    case TelnetNegotiate():
-                        if op := self.telnet_options.get(data.option, None):
-                            await op.at_send_negotiate(data)
-                    case TelnetSubNegotiate():
-                        if op := self.telnet_options.get(data.option, None):
-                            await op.at_send_subnegotiate(data)
-                await self.writer.drain()
+            closed = False
+            while not closed and (entry := await self._telnet_out_queue.get())[0]:
+                # each entry should be a TelnetMessage and its bytes.
+                batch, closed = await self.next_batch(entry)
+                await self.write_batch(batch)
         except asyncio.CancelledError:
             return
         except Exception as err:
@@ -854,6 +1272,40 @@ class TelnetService(Service):
 
         self.external = settings.PORTAL_INTERFACE
         self.port = settings.PORTAL_TELNET
+        self.max_line_length = settings.PORTAL_TELNET_MAX_LINE_LENGTH
+        self.max_input_buffer = settings.PORTAL_TELNET_MAX_INPUT_BUFFER
+        self.max_write_batch = settings.PORTAL_TELNET_MAX_WRITE_BATCH
+        self.write_latency = settings.PORTAL_TELNET_WRITE_LATENCY
+        self.output_soft_limit = settings.PORTAL_TELNET_OUTPUT_SOFT_LIMIT
+        self.output_hard_limit = settings.PORTAL_TELNET_OUTPUT_HARD_LIMIT
+        self.max_pending_input = settings.PORTAL_MAX_PENDING_INPUT
+
+        self.disabled_options = set()
+        if not settings.PORTAL_MCCP2:
+            self.disabled_options.add(TelnetCode.MCCP2)
+        if not settings.PORTAL_MCCP3:
+            self.disabled_options.add(TelnetCode.MCCP3)
+        # MCCP2 streams are zlib format, so raw deflate and gzip wbits won't do.
+        for name, low, high in (
+            ("PORTAL_MCCP_LEVEL", -1, 9),
+            ("PORTAL_MCCP_WBITS", 9, 15),
+            ("PORTAL_MCCP_MEMLEVEL", 1, 9),
+        ):
+            value = getattr(settings, name)
+            if not isinstance(value, int) or not low <= value <= high:
+                raise ValueError(
+                    f"{name} must be an integer from {low} to {high}, not {value!r}."
+                )
+        self.mccp_level = settings.PORTAL_MCCP_LEVEL
+        self.mccp_wbits = settings.PORTAL_MCCP_WBITS
+        self.mccp_memlevel = settings.PORTAL_MCCP_MEMLEVEL
+        self.mccp_min_output = settings.PORTAL_MCCP_MIN_OUTPUT
+        self.mccp_thread_min_size = settings.PORTAL_MCCP_THREAD_MIN_SIZE
+        self.compression_executor = None
+        if threads := settings.PORTAL_MCCP_THREADS:
+            self.compression_executor = ThreadPoolExecutor(
+                max_workers=threads, thread_name_prefix="mccp"
+            )
 
     async def start(self):
         # Create the server and start listening on the specified address and port
@@ -865,8 +1317,16 @@ class TelnetService(Service):
         logging.info(f"Telnet server started on {self.external}:{self.port}")
 
         # Run the server until the service is stopped
-        async with self.server:
-            await self.server.serve_forever()
+        try:
+            async with self.server:
+                await self.server.serve_forever()
+        finally:
+            await self.at_stop()
+
+    async def at_stop(self):
+        if self.compression_executor:
+            self.compression_executor.shutdown(wait=False, cancel_futures=True)
+            self.compression_executor = None
 
     async def handle_client(
         self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
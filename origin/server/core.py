@@ -1,5 +1,8 @@
 import socketio
 import asyncio
+import heapq
+import inspect
+import logging
 import queue
 import time
 from sanic import Sanic, response
@@ -12,24 +15,231 @@ from origin.utils.utils import class_from_module, callables_from_module
 
 
 class GameTask:
-    __slots__ = ["name", "interval", "countdown", "function"]
-
-    def __init__(self, name: str, interval: float, function):
+    __slots__ = [
+        "name",
+        "interval",
+        "countdown",
+        "function",
+        "after",
+        "budget",
+        "runs",
+        "overruns",
+        "last_duration",
+        "total_duration",
+    ]
+
+    def __init__(
+        self,
+        name: str,
+        interval: float,
+        function,
+        after: list[str] = (),
+        budget: float | None = None,
+    ):
         self.name = name
         self.interval = interval
         self.countdown = interval
         self.function = function
-
-    async def update(self, core, delta_time: float):
+        # Names of tasks which must finish first whenever they run in the same tick.
+        self.after = list(after)
+        # Seconds this task should take per run. Exceeding it is logged and counted.
+        self.budget = budget
+        self.runs = 0
+        self.overruns = 0
+        self.last_duration = 0.0
+        self.total_duration = 0.0
+
+    def due(self, delta_time: float) -> float | None:
+        """
+        Advance the countdown. Returns this run's delta time if the task is due.
+        """
         self.countdown -= delta_time
         if self.countdown <= 0:
             task_delta = self.interval + abs(self.countdown)
-            await self.function(core, task_delta)
             self.countdown += self.interval
+            return task_delta
+        return None
+
+    async def run(self, core, task_delta: float):
+        start = time.perf_counter()
+        try:
+            await self.function(core, task_delta)
+        except Exception as err:
+            logging.exception(f"Error running game task {self.name}.")
+        duration = time.perf_counter() - start
+        self.runs += 1
+        self.last_duration = duration
+        self.total_duration += duration
+        if self.budget is not None and duration > self.budget:
+            self.overruns += 1
+            logging.warning(
+                f"Game task {self.name} took {duration * 1000:.1f}ms, over its "
+                f"{self.budget * 1000:.1f}ms budget."
+            )
+
+    async def update(self, core, delta_time: float):
+        if (task_delta := self.due(delta_time)) is not None:
+            await self.run(core, task_delta)
+
+
+class TickStats:
+    """
+    Accounting for game ticks which ran past their interval.
+    """
+
+    __slots__ = ["ticks", "overruns", "skipped", "total_lag", "max_lag"]
+
+    def __init__(self):
+        self.ticks = 0
+        self.overruns = 0
+        self.skipped = 0
+        self.total_lag = 0.0
+        self.max_lag = 0.0
+
+    def record(self, lag: float, interval: float) -> int:
+        """
+        Record a tick which finished lag seconds late. Returns the number of whole
+        intervals that were skipped because of it.
+        """
+        self.ticks += 1
+        if lag <= 0:
+            return 0
+        skipped = int(lag // interval)
+        self.overruns += 1
+        self.skipped += skipped
+        self.total_lag += lag
+        self.max_lag = max(self.max_lag, lag)
+        return skipped
+
+
+class Timer:
+    __slots__ = [
+        "when",
+        "seq",
+        "callback",
+        "args",
+        "key",
+        "repeat",
+        "cancelled",
+        "scheduled",
+    ]
+
+    def __init__(self, when: float, seq: int, callback, args, key, repeat):
+        self.when = when
+        self.seq = seq
+        self.callback = callback
+        self.args = args
+        self.key = key
+        self.repeat = repeat
+        self.cancelled = False
+        # Whether it's in the Scheduler's heap, waiting to fire.
+        self.scheduled = True
+
+    def __lt__(self, other):
+        return (self.when, self.seq) < (other.when, other.seq)
+
+    def __repr__(self):
+        return f"<Timer {self.key or self.callback} at {self.when:.3f}>"
+
+
+class Scheduler:
+    """
+    A min-heap of Timers. Scheduling is O(log n). Cancelling marks the Timer dead in
+    O(1); dead Timers are skipped when popped, and the heap is rebuilt once they make
+    up more than half of it so memory stays bounded.
+
+    A Timer may have a key. Scheduling with a key that's already pending replaces the
+    old Timer, which makes things like "respawn in 30s" idempotent.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.heap: list[Timer] = list()
+        self.keys: dict = dict()
+        self.seq = 0
+        self.cancelled = 0
+
+    def __len__(self):
+        return len(self.heap) - self.cancelled
+
+    def schedule(self, delay: float, callback, *args, key=None, repeat=None) -> Timer:
+        if key is not None:
+            self.cancel(key)
+        self.seq += 1
+        timer = Timer(self.clock() + delay, self.seq, callback, args, key, repeat)
+        heapq.heappush(self.heap, timer)
+        if key is not None:
+            self.keys[key] = timer
+        return timer
+
+    def cancel(self, timer_or_key) -> bool:
+        """
+        Cancel a pending Timer. Returns False if it had already fired or been
+        cancelled.
+        """
+        if isinstance(timer_or_key, Timer):
+            timer = timer_or_key
+        elif (timer := self.keys.get(timer_or_key, None)) is None:
+            return False
+        if timer.cancelled or not timer.scheduled:
+            return False
+        timer.cancelled = True
+        self.cancelled += 1
+        if timer.key is not None and self.keys.get(timer.key, None) is timer:
+            del self.keys[timer.key]
+        if self.cancelled > len(self.heap) // 2:
+            self.heap = [t for t in self.heap if not t.cancelled]
+            heapq.heapify(self.heap)
+            self.cancelled = 0
+        return True
+
+    def pending(self, key) -> bool:
+        return key in self.keys
+
+    def pop_due(self, now: float | None = None) -> list[Timer]:
+        if now is None:
+            now = self.clock()
+        due = list()
+        heap = self.heap
+        while heap and heap[0].when <= now:
+            timer = heapq.heappop(heap)
+            if timer.cancelled:
+                timer.scheduled = False
+                self.cancelled -= 1
+                continue
+            if timer.repeat:
+                timer.when += timer.repeat
+                if timer.when <= now:
+                    # Skip, rather than burst through, intervals we've fallen behind on.
+                    timer.when = now + timer.repeat
+                self.seq += 1
+                timer.seq = self.seq
+                heapq.heappush(heap, timer)
+            else:
+                timer.scheduled = False
+                if timer.key is not None:
+                    del self.keys[timer.key]
+            due.append(timer)
+        return due
+
+    async def run_due(self, now: float | None = None) -> int:
+        """
+        Run every Timer due by now, in order. Returns how many ran.
+        """
+        due = self.pop_due(now)
+        for timer in due:
+            try:
+                result = timer.callback(*timer.args)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as err:
+                logging.exception(f"Error running scheduled {timer}.")
+        return len(due)
 
 
 class ServerCore:
     def __init__(self, app: Sanic):
+        origin.GAME = self
         self.app = app
         sio = socketio.AsyncServer(async_mode="sanic", namespaces="*")
         origin.SOCKETIO = sio
@@ -39,6 +249,20 @@ class ServerCore:
         self.settings = app.ctx.settings
         self.tasks = list()
         self.db = None
+        self.command_queue = None
+        self.pathfinder = None
+        self.scheduler = Scheduler()
+        self.tick_stats = TickStats()
+
+        # Per-session ordered input. Each connected session gets a queue and a worker
+        # task, so a session's events run strictly in order while different sessions
+        # are serviced concurrently.
+        self.input_queues: dict[str, asyncio.Queue] = dict()
+        self.input_workers: dict[str, asyncio.Task] = dict()
+        # Entries waiting to be written to the input_journal collection.
+        self.input_journal: list[dict] = list()
+        # When each session last sent input, waiting to be written to it.
+        self.session_activity: dict[str, float] = dict()
 
         # app.register_listener(self.setup_shared_ctx, "before_server_start")
 
@@ -46,6 +270,8 @@ class ServerCore:
         app.register_listener(self.handle_extra_loaders, "before_server_start")
         app.register_listener(self.setup_db, "before_server_start")
         app.register_listener(self.setup_tasks, "before_server_start")
+        app.register_listener(self.setup_password_hasher, "before_server_start")
+        app.register_listener(self.stop_password_hasher, "after_server_stop")
 
         # app.register_listener(self.handle_task_queue, "before_server_start")
 
@@ -110,6 +336,11 @@ class ServerCore:
         for k, v in self.settings.PARSERS.items():
             origin.PARSERS[k] = class_from_module(v)()
 
+        origin.COMMAND_DISPATCHER = origin.CLASSES["command_dispatcher"]()
+        origin.CONTENTS_INDEX = origin.CLASSES["contents_index"](
+            max_size=self.settings.CONTENTS_INDEX_SIZE
+        )
+
     async def setup_db(self, app, loop):
         settings = self.settings
         db = origin.CLASSES["database"](
@@ -117,6 +348,8 @@ class ServerCore:
             settings.ARANGO_DATABASE,
             settings.ARANGO_USERNAME,
             settings.ARANGO_PASSWORD,
+            cache_size=settings.DATABASE_CACHE_SIZE,
+            write_behind=settings.DATABASE_WRITE_BEHIND,
         )
         self.db = db
         origin.DB = db
@@ -124,53 +357,255 @@ class ServerCore:
             db.managers[k] = class_from_module(v)(db)
         self.app.ctx.db = db
         await db.initialize()
+        if settings.GRID_CHUNK_MIGRATE:
+            migrated = await db.managers["grid_chunk"].migrate(
+                chunk_size=settings.GRID_CHUNK_SIZE
+            )
+            for grid, count in migrated.items():
+                logging.info(f"Migrated {grid} into {count} chunks.")
+
+    async def setup_password_hasher(self, app, loop):
+        settings = self.settings
+        hasher = origin.CLASSES["password_hasher"](
+            executor=settings.PASSWORD_HASHER_EXECUTOR,
+            workers=settings.PASSWORD_HASHER_WORKERS,
+            max_pending=settings.PASSWORD_HASHER_MAX_PENDING,
+        )
+        hasher.start()
+        origin.PASSWORD_HASHER = hasher
+
+    async def stop_password_hasher(self, app, loop):
+        if origin.PASSWORD_HASHER is not None:
+            origin.PASSWORD_HASHER.shutdown()
 
     async def setup_tasks(self, app, loop):
+        settings = self.settings
+        command_queue = origin.CLASSES["command_queue"](
+            per_tick=settings.SIMULATION_COMMANDS_PER_TICK,
+            persist=settings.SIMULATION_COMMANDS_PERSIST,
+        )
+        if command_queue.persist:
+            await command_queue.recover(self.db)
+        self.command_queue = command_queue
+        origin.COMMAND_QUEUE = command_queue
+
+        pathfinder = origin.CLASSES["pathfinder"](
+            budget=settings.PATHFINDING_BUDGET,
+            max_nodes=settings.PATHFINDING_MAX_NODES,
+            cache_size=settings.PATHFINDING_CACHE_SIZE,
+        )
+        self.pathfinder = pathfinder
+        origin.PATHFINDER = pathfinder
+
         for k, v in self.settings.TASKS.items():
             interval = v.get("interval", 0.0)
             path = v.get("path")
             func = class_from_module(path)
-            gtask = GameTask(k, interval, func)
+            gtask = GameTask(
+                k, interval, func, after=v.get("after", ()), budget=v.get("budget")
+            )
             self.tasks.append(gtask)
+        self.check_task_dependencies()
         app.add_task(self.run_game)
 
+    def check_task_dependencies(self):
+        tasks = {task.name: task for task in self.tasks}
+        for task in self.tasks:
+            for dep in task.after:
+                if dep not in tasks:
+                    raise ValueError(f"Game task {task.name} depends on unknown {dep}.")
+
+        visiting, visited = set(), set()
+
+        def visit(name: str):
+            if name in visited:
+                return
+            if name in visiting:
+                raise ValueError(f"Game task dependency cycle involving {name}.")
+            visiting.add(name)
+            for dep in tasks[name].after:
+                visit(dep)
+            visiting.remove(name)
+            visited.add(name)
+
+        for name in tasks:
+            visit(name)
+
     async def run_game(self):
-        delta_time = 0.1
-        frequency = 0.1
+        interval = self.settings.GAME_TICK_INTERVAL
+        delta_time = interval
+        next_tick = time.perf_counter()
+        last_warning = 0.0
 
         while True:
             start = time.perf_counter()
             await self.run_tasks(delta_time)
+            try:
+                await self.db.flush()
+            except Exception:
+                # Whatever wasn't written is still buffered for the next tick.
+                logging.exception("Error flushing buffered database writes.")
             end = time.perf_counter()
 
-            duration = end - start
-
-            remaining = frequency - duration
-
-            if remaining > 0:
-                await asyncio.sleep(remaining)
-
-            now = time.perf_counter()
-            delta_time = now - start
+            # Ticks are scheduled on a fixed grid so that sleep overshoot doesn't drift.
+            next_tick += interval
+            lag = end - next_tick
+            skipped = self.tick_stats.record(lag, interval)
+
+            if lag > 0:
+                # Start the next tick immediately. Tasks see the lost time through
+                # delta_time, so nothing is dropped.
+                next_tick = end
+                if end - last_warning >= 10.0:
+                    last_warning = end
+                    stats = self.tick_stats
+                    logging.warning(
+                        f"Game tick overran by {lag * 1000:.1f}ms ({skipped} intervals "
+                        f"skipped). {stats.overruns}/{stats.ticks} ticks have overrun, "
+                        f"max lag {stats.max_lag * 1000:.1f}ms."
+                    )
+            else:
+                await asyncio.sleep(-lag)
+
+            delta_time = time.perf_counter() - start
 
     async def run_tasks(self, delta_time: float):
+        """
+        Run every due task concurrently. A task waits only for the tasks named in its
+        after list, and only if they are also running this tick.
+        """
+        due = dict()
         for task in self.tasks:
-            await task.update(self, delta_time)
-
-    async def connect_handler(self, sid, environ):
+            if (task_delta := task.due(delta_time)) is not None:
+                due[task.name] = task_delta
+
+        if due:
+            finished = {name: asyncio.Event() for name in due}
+
+            async def run(task: GameTask):
+                try:
+                    for dep in task.after:
+                        if dep in finished:
+                            await finished[dep].wait()
+                    await task.run(self, due[task.name])
+                finally:
+                    finished[task.name].set()
+
+            await asyncio.gather(*[run(t) for t in self.tasks if t.name in due])
+
+        await self.scheduler.run_due()
+
+    def schedule(self, delay: float, callback, *args, key=None, repeat=None) -> Timer:
+        """
+        Call callback(*args) on the first game tick at least delay seconds from now.
+        Coroutine functions are awaited.
+
+        If key is given, any pending Timer with the same key is replaced. If repeat
+        is given, the Timer fires again every repeat seconds until cancelled.
+        """
+        return self.scheduler.schedule(delay, callback, *args, key=key, repeat=repeat)
+
+    def cancel(self, timer_or_key) -> bool:
+        return self.scheduler.cancel(timer_or_key)
+
+    def enqueue_input(self, sid: str, func, *args):
+        """
+        Schedule func(*args) on the session's input queue, starting its worker if needed.
+        """
+        if (input_queue := self.input_queues.get(sid, None)) is None:
+            input_queue = asyncio.Queue()
+            self.input_queues[sid] = input_queue
+            self.input_workers[sid] = asyncio.create_task(
+                self.run_session_input(sid, input_queue)
+            )
+        input_queue.put_nowait((func, args))
+
+    async def run_session_input(self, sid: str, input_queue: asyncio.Queue):
+        try:
+            while (item := await input_queue.get()) is not None:
+                func, args = item
+                try:
+                    await func(*args)
+                except Exception as err:
+                    logging.exception(f"Error processing input for session {sid}.")
+        finally:
+            self.input_queues.pop(sid, None)
+            self.input_workers.pop(sid, None)
+
+    async def start_session(self, sid: str):
         sess_manager = self.db.managers["session"]
         sess = await sess_manager.create_document(data=dict(), key=sid)
         await sess.start()
 
-    async def disconnect_handler(self, sid):
+    async def end_session(self, sid: str):
         if sess := await self.db.getDocument(f"session/{sid}"):
             await sess.handle_disconnect()
 
-    async def message_handler(self, event, sid, message):
-        sess_manager = self.db.managers["session"]
+    async def dispatch_event(self, sid: str, event: str, message):
         if sess := await self.db.getDocument(f"session/{sid}"):
+            await self.journal_input(sess, event, message)
             await sess.handle_event(event, message)
 
+    async def journal_input(self, sess, event: str, message):
+        """
+        Note the session's activity and, if SESSION_INPUT_JOURNAL is enabled,
+        journal the event. Input to a parser which doesn't allow journaling, such
+        as passwords typed at login, is never journaled.
+        """
+        now = time.time()
+        self.session_activity[sess.id] = now
+        if not (self.settings.SESSION_INPUT_JOURNAL and event in origin.SERVER_EVENTS):
+            return
+        parser = origin.PARSERS.get(await sess.get_field("parser"), None)
+        if parser is not None and not parser.journal_input:
+            return
+        self.input_journal.append(
+            {
+                "session": sess.id,
+                "event": event,
+                "message": message,
+                "timestamp": now,
+            }
+        )
+
+    async def flush_input_journal(self):
+        """
+        Write journaled input in one query, and record each session's last activity.
+        """
+        if entries := self.input_journal:
+            self.input_journal = list()
+            async for _ in self.db.query(
+                "FOR entry IN @entries INSERT entry INTO input_journal",
+                entries=entries,
+            ):
+                pass
+        activity, self.session_activity = self.session_activity, dict()
+        for sess_id, timestamp in activity.items():
+            try:
+                sess = await self.db.getDocument(sess_id)
+            except self.db.DatabaseException:
+                continue
+            await sess.set_field("last_activity", int(timestamp * 1000))
+
+    async def connect_handler(self, sid, environ):
+        self.enqueue_input(sid, self.start_session, sid)
+
+    async def disconnect_handler(self, sid):
+        self.enqueue_input(sid, self.end_session, sid)
+        self.input_queues[sid].put_nowait(None)
+
+    async def message_handler(self, event, sid, message):
+        input_queue = self.input_queues.get(sid, None)
+        if (
+            input_queue is not None
+            and input_queue.qsize() >= self.settings.SESSION_MAX_PENDING_INPUT
+        ):
+            logging.warning(
+                f"Dropped {event} from session {sid}: too much input waiting."
+            )
+            return
+        self.enqueue_input(sid, self.dispatch_event, sid, event, message)
+
 
 def create_application(settings) -> Sanic:
     origin.SETTINGS = settings
@@ -1,11 +1,14 @@
 import origin
 
 from .parser import SessionParser
+from origin.db.users import HasherBusy
 from enum import IntEnum
 
 
 class LoginParser(SessionParser):
     name = "login"
+    # Its input includes passwords.
+    journal_input = False
 
     async def welcome_screen(self, session):
         await session.send_text("HELLO WELCOME SCREEN HERE!")
@@ -85,6 +88,10 @@ class LoginParser(SessionParser):
             user = await users.create_user(**data)
             if not count:
                 session.send_text("FIRST USER TO BE CREATED. THIS USER IS A SUPERUSER.")
+        except HasherBusy as err:
+            # Keep the entered details, so confirming the password again retries.
+            await session.send_text(str(err))
+            return
         except Exception as err:
             await session.send_text(str(err))
             await self.clear(session)
@@ -123,7 +130,13 @@ class LoginParser(SessionParser):
 
         user = await origin.DB.getDocument(state.get("user"))
 
-        if await user.authenticate(text):
+        try:
+            authenticated = await user.authenticate(text)
+        except HasherBusy as err:
+            await session.send_text(str(err))
+            return
+
+        if authenticated:
             await self.login(session, user)
         else:
             await session.send_text(
@@ -13,7 +13,9 @@ class MainMenuParser(SessionParser):
     async def render(self, session):
         user = await session.get_proxy("user")
 
-        if sessions := [await x.getDocument() async for x in user.sessions()]:
+        if sessions := await origin.DB.getDocuments(
+            [x.id async for x in user.sessions()], proxy=False
+        ):
             sess_table = {"title": "Sessions", "columns": ["ID", "IP", "Client"]}
             rows = list()
             for sess in sessions:
@@ -21,7 +23,9 @@ class MainMenuParser(SessionParser):
             sess_table["rows"] = rows
             await session.send_event("RichTable", sess_table)
 
-        if characters := [await x.getDocument() async for x in user.characters()]:
+        if characters := await origin.DB.getDocuments(
+            [x.id async for x in user.characters()], proxy=False
+        ):
             char_table = {
                 "title": "Characters",
                 "columns": [
@@ -70,7 +74,11 @@ class MainMenuParser(SessionParser):
     async def handle_play(self, session, args: str):
         user = await session.get_proxy("user")
 
-        if not (characters := [await x.getDocument() async for x in user.characters()]):
+        if not (
+            characters := await origin.DB.getDocuments(
+                [x.id async for x in user.characters()], proxy=False
+            )
+        ):
             await session.send_text("You have no characters!")
             return
 
@@ -4,6 +4,8 @@ from origin.utils.utils import callables_from_module
 
 class SessionParser:
     name = None
+    # Whether input to this parser may be written to the input journal.
+    journal_input = True
 
     async def parse(self, session, text: str):
         pass
@@ -12,6 +12,44 @@ SERVER_PORT = 8000
 PORTAL_INTERFACE = "0.0.0.0"
 # The port that the portal will use for telnet.
 PORTAL_TELNET = 7999
+# Telnet input lines longer than this many characters are truncated.
+PORTAL_TELNET_MAX_LINE_LENGTH = 4096
+# At most this many bytes of telnet input lines are accepted at once. Lines beyond
+# it are dropped.
+PORTAL_TELNET_MAX_INPUT_BUFFER = 65536
+# Telnet output which is queued together is written, and compressed, as one batch
+# of up to about this many bytes.
+PORTAL_TELNET_MAX_WRITE_BATCH = 65536
+# How many seconds the telnet writer may hold output to let more join its batch.
+# With 0, only output which is already queued is batched.
+PORTAL_TELNET_WRITE_LATENCY = 0.0
+# Once more than this many bytes of output are waiting for a telnet client, GMCP
+# updates are coalesced with queued ones for the same command, or dropped.
+PORTAL_TELNET_OUTPUT_SOFT_LIMIT = 262144
+# A telnet client with more than this many bytes of output waiting is disconnected.
+PORTAL_TELNET_OUTPUT_HARD_LIMIT = 4194304
+# How many input messages a connection may have waiting to go to the game before
+# the portal stops reading from it.
+PORTAL_MAX_PENDING_INPUT = 256
+
+# Whether telnet clients are offered MCCP2 (compressed output) and MCCP3
+# (compressed input).
+PORTAL_MCCP2 = True
+PORTAL_MCCP3 = True
+# zlib settings for MCCP2. Higher levels save bandwidth at the cost of portal CPU;
+# lower wbits and memlevel shrink each connection's compressor, which is about
+# 256KB at the defaults. Levels run from -1 to 9, wbits from 9 to 15 and memlevel
+# from 1 to 9; the portal won't start with anything else.
+PORTAL_MCCP_LEVEL = 6
+PORTAL_MCCP_WBITS = 15
+PORTAL_MCCP_MEMLEVEL = 8
+# Compression starts once a connection has written this many bytes, so brief
+# connections such as MSSP crawlers never allocate a compressor.
+PORTAL_MCCP_MIN_OUTPUT = 2048
+# If above 0, output batches of at least PORTAL_MCCP_THREAD_MIN_SIZE bytes are
+# compressed in a pool of this many threads rather than on the portal's loop.
+PORTAL_MCCP_THREADS = 0
+PORTAL_MCCP_THREAD_MIN_SIZE = 32768
 
 PORTAL_URL_TO_GAME = "http://127.0.0.1:8000"
 
@@ -19,7 +57,14 @@ PORTAL_URL_TO_GAME = "http://127.0.0.1:8000"
 SERVER_CLASSES = dict()
 SERVER_CLASSES["core"] = "origin.server.core.ServerCore"
 SERVER_CLASSES["database"] = "origin.db.core.DatabaseManager"
+# For tests and benchmarks, an in-process stand-in which needs no ArangoDB server:
+# SERVER_CLASSES["database"] = "origin.db.memory.MemoryDatabaseManager"
 SERVER_CLASSES["searcher"] = "origin.utils.search.Searcher"
+SERVER_CLASSES["command_queue"] = "origin.tasks.simulation.CommandQueue"
+SERVER_CLASSES["command_dispatcher"] = "origin.commands.dispatcher.CommandDispatcher"
+SERVER_CLASSES["contents_index"] = "origin.utils.keywords.ContentsIndex"
+SERVER_CLASSES["pathfinder"] = "origin.utils.pathfinding.Pathfinder"
+SERVER_CLASSES["password_hasher"] = "origin.db.users.PasswordHasher"
 
 
 PARSERS = {
@@ -44,6 +89,8 @@ COLLECTION_MANAGERS = {
     "playview": "origin.db.playviews.PlayviewManager",
     "object": "origin.db.objects.ObjectManager",
     "location": "origin.db.locations.LocationManager",
+    "input_journal": "origin.db.sessions.InputJournalManager",
+    "grid_chunk": "origin.db.grids.GridChunkManager",
 }
 
 # Do be sure to change these as needed.
@@ -52,6 +99,15 @@ ARANGO_DATABASE = "origin"
 ARANGO_USERNAME = "origin"
 ARANGO_PASSWORD = "origin"
 
+# The maximum number of documents the server keeps in its in-process document cache.
+# Set to 0 to disable caching entirely.
+DATABASE_CACHE_SIZE = 10000
+
+# If enabled, document patches are buffered and combined per document, then written
+# in bulk at the end of every game tick. Code which needs a write to land immediately
+# can call origin.DB.flush().
+DATABASE_WRITE_BEHIND = False
+
 AUTOPROXY_CLASSES = {
     "user": "origin.db.users.User",
     "session": "origin.db.sessions.Session",
@@ -134,13 +190,70 @@ ENSURE_OBJECTS = {
 
 TILE_MODULES = ["origin.assets.tiles"]
 
+# Chunked Grids keep their features in grid_chunk Documents of this many cells
+# square, so only the chunks in view are ever loaded. If enabled, every Grid still
+# storing its features in its own Document is migrated at startup.
+GRID_CHUNK_SIZE = 16
+GRID_CHUNK_MIGRATE = False
+
+
+# How many containers' keyword indexes to keep in memory for searches.
+CONTENTS_INDEX_SIZE = 10000
+
+# Password hashing runs off the event loop: "process", "thread" or "inline".
+PASSWORD_HASHER_EXECUTOR = "process"
+# How many hashes may run at once. 0 means min(4, CPU count).
+PASSWORD_HASHER_WORKERS = 0
+# How many more may wait for a worker before login attempts are turned away.
+PASSWORD_HASHER_MAX_PENDING = 32
+
+# How many queued commands each Object may execute per game tick.
+SIMULATION_COMMANDS_PER_TICK = 1
+# If enabled, queued commands are mirrored to each Object's pending_commands field
+# and reloaded at startup, so they survive a crash.
+SIMULATION_COMMANDS_PERSIST = False
 
+# If enabled, session input is also written to the input_journal collection, in
+# batches, by the session_journal task. Input to the login parser, which includes
+# passwords, is never journaled.
+SESSION_INPUT_JOURNAL = False
+
+# How many events a session may have waiting to be processed. Further input from
+# it is dropped, with a warning, until it catches up. Connecting and disconnecting
+# are always queued.
+SESSION_MAX_PENDING_INPUT = 256
+
+# Queued path requests are planned by the pathfinding task, for at most this many
+# seconds per tick. A search gives up after expanding PATHFINDING_MAX_NODES cells,
+# and each Grid remembers its PATHFINDING_CACHE_SIZE most recent paths.
+PATHFINDING_BUDGET = 0.005
+PATHFINDING_MAX_NODES = 20000
+PATHFINDING_CACHE_SIZE = 256
+
+# Seconds per game tick.
+GAME_TICK_INTERVAL = 0.1
+
+# Game tasks run every interval seconds (0 means every tick). Due tasks run
+# concurrently; "after" lists tasks which must finish first when they run in the
+# same tick, and "budget" is a time in seconds whose overruns are logged.
+#
+# A tick ends only when all of its tasks have, so a task must never await work
+# which another task completes, such as the Future from PATHFINDER.request(): that
+# work may not be done until a later tick, which never comes. Within a task, plan
+# with find_path(), or attach a callback to the Future instead of awaiting it.
 TASKS = {
-    "session_input": {"interval": 0.0, "path": "origin.tasks.session.session_input"},
+    "session_journal": {
+        "interval": 1.0,
+        "path": "origin.tasks.session.session_journal",
+    },
     "simulation_commands": {
         "interval": 0.0,
         "path": "origin.tasks.simulation.simulation_commands",
     },
+    "pathfinding": {
+        "interval": 0.0,
+        "path": "origin.tasks.pathfinding.pathfinding",
+    },
 }
 
 COMMAND_SETS = {"informative": "origin.commands.informative.COMMANDS"}
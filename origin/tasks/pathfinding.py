@@ -0,0 +1,9 @@
+from .base import TaskRunner
+
+
+class Pathfinding(TaskRunner):
+    async def run(self, core, delta_time: float):
+        await core.pathfinder.run()
+
+
+pathfinding = Pathfinding()
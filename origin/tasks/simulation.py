@@ -1,20 +1,97 @@
+import logging
+import time
+from collections import deque
+
 import origin
+
 from .base import TaskRunner
 
 
-class SimulationCommands(TaskRunner):
-    async def run(self, core, delta_time: float):
-        async for (docid, command, proxy) in core.db.query(
-            """
+class CommandQueue:
+    """
+    Pending commands for every Object which has any, held in memory.
+
+    Only Objects with queued commands are tracked, so draining costs nothing for idle
+    ones. Each tick, drain() takes up to per_tick commands per Object, round-robin, and
+    moves the tick's first Object to the back of the line so that no Object is always
+    served first. An error from one command is logged and doesn't stop the rest.
+
+    If persist is enabled, each Object's queue is mirrored to its pending_commands
+    field so that it survives a crash, and recover() reloads them at startup.
+    """
+
+    def __init__(self, per_tick: int = 1, persist: bool = False):
+        self.per_tick = per_tick
+        self.persist = persist
+        self.objects: dict[str, "Object"] = dict()
+        self.pending: dict[str, deque[str]] = dict()
+
+    def __len__(self):
+        return len(self.pending)
+
+    def __contains__(self, obj):
+        return obj.id in self.pending
+
+    async def push(self, obj: "Object", commands: list[str]):
+        if not commands:
+            return
+        if (queue := self.pending.get(obj.id, None)) is None:
+            queue = deque()
+            self.pending[obj.id] = queue
+            self.objects[obj.id] = obj
+        queue.extend(commands)
+        if self.persist:
+            await obj.set_field("pending_commands", list(queue))
+
+    def take(self) -> list[tuple["Object", str]]:
+        """
+        Remove and return this tick's (Object, command) pairs.
+        """
+        out = list()
+        leader = next(iter(self.pending), None)
+        for _ in range(self.per_tick):
+            if not self.pending:
+                break
+            for id in list(self.pending.keys()):
+                queue = self.pending[id]
+                out.append((self.objects[id], queue.popleft()))
+                if not queue:
+                    del self.pending[id]
+                    del self.objects[id]
+        # This tick's first Object goes to the back of the line for the next one.
+        if leader in self.pending:
+            self.pending[leader] = self.pending.pop(leader)
+        return out
+
+    async def drain(self):
+        batch = self.take()
+        now = int(time.time() * 1000)
+        for obj in {obj.id: obj for obj, command in batch}.values():
+            data = {"last_activity": now}
+            if self.persist:
+                queue = self.pending.get(obj.id, None)
+                data["pending_commands"] = list(queue) if queue else None
+            await obj.patchDocument(data, params={"keepNull": "false"})
+        for obj, command in batch:
+            try:
+                await obj.execute_command(command)
+            except Exception:
+                logging.exception(f"Error executing {command!r} for {obj.id}.")
+
+    async def recover(self, db):
+        async for docid, commands, proxy in db.query("""
             FOR doc IN object
             FILTER COUNT(doc.pending_commands) > 0
-            LET command = FIRST(doc.pending_commands)
-            UPDATE doc WITH {pending_commands: SHIFT(doc.pending_commands), last_activity: DATE_NOW()} IN object
-            RETURN [doc._id, command, doc.proxy]
-            """
-        ):
-            sess = origin.AUTOPROXY[proxy](docid, core.db)
-            await sess.execute_command(command)
+            RETURN [doc._id, doc.pending_commands, doc.proxy]
+            """):
+            queue = deque(commands)
+            self.pending[docid] = queue
+            self.objects[docid] = origin.AUTOPROXY[proxy](docid, db)
+
+
+class SimulationCommands(TaskRunner):
+    async def run(self, core, delta_time: float):
+        await core.command_queue.drain()
 
 
 simulation_commands = SimulationCommands()
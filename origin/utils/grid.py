@@ -0,0 +1,123 @@
+from collections import OrderedDict, defaultdict
+
+
+def cell_key(x: int, y: int) -> str:
+    return f"{x},{y}"
+
+
+def parse_cell_key(key: str) -> tuple[int, int]:
+    x, y = key.split(",", 1)
+    return int(x), int(y)
+
+
+class SpatialIndex:
+    """
+    A Grid's features, indexed by coordinates.
+
+    Features are held in a coordinate hash, and their coordinates bucketed into
+    chunk_size square chunks. A viewport query either probes every cell in the
+    viewport or scans the chunks it overlaps, whichever touches fewer entries, so it
+    costs O(viewport) rather than O(features).
+    """
+
+    chunk_size = 16
+
+    def __init__(self, features, chunk_size: int = None):
+        if chunk_size:
+            self.chunk_size = chunk_size
+        self.cells: dict[tuple[int, int], dict] = dict()
+        self.chunks: dict[tuple[int, int], list[tuple[int, int]]] = defaultdict(list)
+        for coordinates, data in features or []:
+            self.set(*coordinates, data)
+
+    @classmethod
+    def from_cells(cls, cells: dict, chunk_size: int = None):
+        """
+        Build from an object of cell_key(x, y) -> data, as grid chunks store them.
+        """
+        return cls(
+            ((parse_cell_key(k), v) for k, v in (cells or dict()).items()), chunk_size
+        )
+
+    def __len__(self):
+        return len(self.cells)
+
+    def __contains__(self, coordinates):
+        return tuple(coordinates) in self.cells
+
+    def chunk_of(self, x: int, y: int) -> tuple[int, int]:
+        return x // self.chunk_size, y // self.chunk_size
+
+    def get(self, x: int, y: int, default=None):
+        return self.cells.get((x, y), default)
+
+    def set(self, x: int, y: int, data: dict):
+        if (x, y) not in self.cells:
+            self.chunks[self.chunk_of(x, y)].append((x, y))
+        self.cells[(x, y)] = data
+
+    def viewport(
+        self, min_x: int, min_y: int, max_x: int, max_y: int
+    ) -> list[tuple[tuple[int, int], dict]]:
+        """
+        Every feature with min_x <= x < max_x and min_y <= y < max_y, in row order.
+        """
+        if max_x <= min_x or max_y <= min_y:
+            return []
+        cells = self.cells
+        area = (max_x - min_x) * (max_y - min_y)
+        min_cx, min_cy = self.chunk_of(min_x, min_y)
+        max_cx, max_cy = self.chunk_of(max_x - 1, max_y - 1)
+        chunks = [
+            chunk
+            for cy in range(min_cy, max_cy + 1)
+            for cx in range(min_cx, max_cx + 1)
+            if (chunk := self.chunks.get((cx, cy), None))
+        ]
+
+        if area <= sum(len(chunk) for chunk in chunks):
+            return [
+                ((x, y), cells[(x, y)])
+                for y in range(min_y, max_y)
+                for x in range(min_x, max_x)
+                if (x, y) in cells
+            ]
+
+        found = [
+            (x, y)
+            for chunk in chunks
+            for x, y in chunk
+            if min_x <= x < max_x and min_y <= y < max_y
+        ]
+        found.sort(key=lambda c: (c[1], c[0]))
+        return [(c, cells[c]) for c in found]
+
+
+class SpatialIndexCache:
+    """
+    Holds the SpatialIndex of recently used Grids, each valid for one _rev of its
+    Grid's Document. At most max_size are kept, the least recently used being dropped.
+    """
+
+    def __init__(self, max_size: int = 64):
+        self.max_size = max_size
+        self.indexes: OrderedDict[str, tuple[str, SpatialIndex]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, id: str, rev: str) -> SpatialIndex | None:
+        if (entry := self.indexes.get(id, None)) is not None and entry[0] == rev:
+            self.indexes.move_to_end(id)
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        return None
+
+    def store(self, id: str, rev: str, index: SpatialIndex):
+        self.indexes[id] = (rev, index)
+        self.indexes.move_to_end(id)
+        while len(self.indexes) > self.max_size:
+            self.indexes.popitem(last=False)
+
+    def discard(self, id: str):
+        self.indexes.pop(id, None)
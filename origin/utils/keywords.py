@@ -0,0 +1,181 @@
+import asyncio
+import itertools
+from bisect import bisect_left, insort
+from collections import OrderedDict
+
+import origin
+
+
+class KeywordIndex:
+    """
+    The contents of one container, indexed by lowercased keyword.
+
+    Entries are kept as a sorted list of (keyword, id) pairs, so every keyword
+    starting with a prefix is found with one bisect and a short scan. Object IDs are
+    returned in the order they were added, as a linear scan of the contents would.
+    """
+
+    def __init__(self):
+        self.entries: list[tuple[str, str]] = list()
+        self.keywords: dict[str, tuple[str, ...]] = dict()
+        self.order: dict[str, int] = dict()
+        self.counter = itertools.count()
+
+    def __len__(self):
+        return len(self.keywords)
+
+    def __contains__(self, id: str):
+        return id in self.keywords
+
+    def add(self, id: str, keywords):
+        """
+        Index id under keywords, replacing any it had. Re-adding an Object keeps its
+        place in the order.
+        """
+        order = self.order.get(id, None)
+        self.remove(id)
+        keywords = tuple(sorted({k.lower() for k in keywords if k}))
+        self.keywords[id] = keywords
+        self.order[id] = next(self.counter) if order is None else order
+        for keyword in keywords:
+            insort(self.entries, (keyword, id))
+
+    def remove(self, id: str):
+        if (keywords := self.keywords.pop(id, None)) is None:
+            return
+        del self.order[id]
+        for keyword in keywords:
+            i = bisect_left(self.entries, (keyword, id))
+            if i < len(self.entries) and self.entries[i] == (keyword, id):
+                del self.entries[i]
+
+    def prefix(self, text: str) -> list[str]:
+        """
+        The IDs of every Object with a keyword starting with text.
+        """
+        text = text.lower()
+        found = set()
+        for i in range(bisect_left(self.entries, (text, "")), len(self.entries)):
+            keyword, id = self.entries[i]
+            if not keyword.startswith(text):
+                break
+            found.add(id)
+        return sorted(found, key=self.order.__getitem__)
+
+
+class ContentsIndex:
+    """
+    KeywordIndexes over the contents of containers, by (container ID, location proxy).
+
+    An index is built from the database the first time a container is searched, and
+    changes reported meanwhile are applied to it before it's stored. From then on it
+    is kept current by Object.add_object_location, remove_from_location and
+    writes to an Object's keyword_fields. At most max_size indexes are kept, the
+    least recently used being dropped.
+
+    Keywords are taken from each Object's appearance with no viewer, so viewer-specific
+    keywords aren't indexed.
+    """
+
+    def __init__(self, max_size: int = 10000):
+        self.max_size = max_size
+        self.indexes: OrderedDict[tuple[str, str], KeywordIndex] = OrderedDict()
+        # Which index each indexed Object is in.
+        self.located: dict[str, tuple[str, str]] = dict()
+        # Indexes being built, and the changes made while they are, which are
+        # applied before they're stored.
+        self.building: dict[tuple[str, str], asyncio.Future] = dict()
+        self.events: dict[tuple[str, str], list[tuple]] = dict()
+
+    def __len__(self):
+        return len(self.indexes)
+
+    async def keywords(self, obj: "Object", doc=None) -> list[str]:
+        appearance = await obj.get_appearance(None, doc=doc)
+        return appearance.keywords
+
+    async def get(self, container: "Object", proxy: str) -> KeywordIndex:
+        key = (container.id, proxy)
+        if (index := self.indexes.get(key, None)) is not None:
+            self.indexes.move_to_end(key)
+            return index
+        if (building := self.building.get(key, None)) is not None:
+            return await asyncio.shield(building)
+
+        future = asyncio.get_running_loop().create_future()
+        self.building[key] = future
+        events = self.events[key] = list()
+        try:
+            index = await self.build(container, proxy, events)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as err:
+            future.set_exception(err)
+            # Retrieved here, so it isn't reported if nothing else was waiting.
+            future.exception()
+            raise
+        else:
+            future.set_result(index)
+        finally:
+            del self.building[key]
+            del self.events[key]
+
+        self.indexes[key] = index
+        for id in index.keywords:
+            self.located[id] = key
+        while len(self.indexes) > self.max_size:
+            self.discard(*next(iter(self.indexes)))
+        return index
+
+    async def build(
+        self, container: "Object", proxy: str, events: list[tuple]
+    ) -> KeywordIndex:
+        """
+        Build an index from the database, then apply events, the changes reported
+        while doing so, until none are left.
+        """
+        index = KeywordIndex()
+        ids = await container._contents_ids_helper(proxy)
+        for doc in await origin.DB.getDocuments(ids, proxy=False):
+            obj = await origin.DB.getProxy(doc)
+            index.add(obj.id, await self.keywords(obj, doc))
+        while events:
+            action, id, obj = events.pop(0)
+            if action == "removed":
+                index.remove(id)
+            elif action == "added" or id in index.keywords:
+                index.add(id, await self.keywords(obj))
+        return index
+
+    async def search(self, container: "Object", proxy: str, text: str) -> list[str]:
+        index = await self.get(container, proxy)
+        return index.prefix(text)
+
+    def discard(self, container_id: str, proxy: str):
+        if (index := self.indexes.pop((container_id, proxy), None)) is not None:
+            for id in index.keywords:
+                self.located.pop(id, None)
+
+    async def added(self, container_id: str, proxy: str, obj: "Object"):
+        self.removed(obj.id)
+        key = (container_id, proxy)
+        if (events := self.events.get(key, None)) is not None:
+            events.append(("added", obj.id, obj))
+        if (index := self.indexes.get(key, None)) is not None:
+            index.add(obj.id, await self.keywords(obj))
+            self.located[obj.id] = key
+
+    def removed(self, id: str):
+        for events in self.events.values():
+            events.append(("removed", id, None))
+        if (key := self.located.pop(id, None)) is not None:
+            if (index := self.indexes.get(key, None)) is not None:
+                index.remove(id)
+
+    async def changed(self, obj: "Object"):
+        for events in self.events.values():
+            events.append(("changed", obj.id, obj))
+        if (key := self.located.get(obj.id, None)) is not None:
+            if (index := self.indexes.get(key, None)) is not None:
+                index.add(obj.id, await self.keywords(obj))
@@ -0,0 +1,534 @@
+import asyncio
+import heapq
+import math
+import time
+from collections import OrderedDict, defaultdict, deque
+
+import origin
+from origin.utils import tiles
+
+INF = math.inf
+SQRT2 = math.sqrt(2)
+
+# (dx, dy, distance) for each move.
+STRAIGHT = ((1, 0, 1.0), (-1, 0, 1.0), (0, 1, 1.0), (0, -1, 1.0))
+DIAGONAL = ((1, 1, SQRT2), (1, -1, SQRT2), (-1, 1, SQRT2), (-1, -1, SQRT2))
+
+
+def tile_cost(name: str) -> float:
+    """
+    The cost of entering a tile, or INF if it can't be entered.
+    """
+    if not (tile := origin.TILES.get(name, None)):
+        return INF
+    if not getattr(tile, "walkable", True):
+        return INF
+    return float(getattr(tile, "cost", 1.0))
+
+
+class WalkGrid:
+    """
+    A snapshot of a Grid's walkability: the cost of entering each cell of a
+    rectangle, INF where it can't be entered, in a flat row-major list. Everything
+    outside the rectangle is blocked.
+    """
+
+    def __init__(self, min_x: int, min_y: int, width: int, height: int, costs):
+        self.min_x = min_x
+        self.min_y = min_y
+        self.width = width
+        self.height = height
+        self.costs: list[float] = costs
+        finite = {c for c in costs if c != INF}
+        self.min_cost = min(finite) if finite else 1.0
+        # Jump point search only applies when every open cell costs the same.
+        self.uniform = len(finite) <= 1
+
+    @classmethod
+    def build(
+        cls,
+        bounds: tuple[int, int, int, int] | None,
+        default_tile: str,
+        features=(),
+        layer=None,
+    ) -> "WalkGrid":
+        """
+        Build from a Grid's inclusive (min_x, min_y, max_x, max_y) bounds, default
+        tile, optional TileLayer, and [coordinates, data] features, whose tiles take
+        precedence. Without bounds, the layer's or features' extent is used.
+        """
+        features = [(tuple(c), data) for c, data in features or ()]
+        if layer is not None:
+            bounds = (layer.min_x, layer.min_y, layer.max_x, layer.max_y)
+        elif bounds is None:
+            if not features:
+                return cls(0, 0, 0, 0, [])
+            xs = [x for (x, y), data in features]
+            ys = [y for (x, y), data in features]
+            bounds = (min(xs), min(ys), max(xs), max(ys))
+        min_x, min_y, max_x, max_y = bounds
+        width, height = max_x - min_x + 1, max_y - min_y + 1
+
+        if layer is not None:
+            open_cost = tiles.np.where(layer.walkable, layer.cost, INF)
+            costs = open_cost.astype(float).ravel().tolist()
+        else:
+            costs = [tile_cost(default_tile)] * (width * height)
+
+        for (x, y), data in features:
+            if not (tile := (data or dict()).get("tile", None)):
+                continue
+            if 0 <= x - min_x < width and 0 <= y - min_y < height:
+                costs[(y - min_y) * width + (x - min_x)] = tile_cost(tile)
+        return cls(min_x, min_y, width, height, costs)
+
+    def index(self, x: int, y: int) -> int | None:
+        lx, ly = x - self.min_x, y - self.min_y
+        if 0 <= lx < self.width and 0 <= ly < self.height:
+            return ly * self.width + lx
+        return None
+
+    def cost(self, x: int, y: int) -> float:
+        if (i := self.index(x, y)) is None:
+            return INF
+        return self.costs[i]
+
+    def walkable(self, x: int, y: int) -> bool:
+        return self.cost(x, y) != INF
+
+    def moves(self, x: int, y: int, diagonal: bool):
+        """
+        Yield (x, y, cost) for each cell that can be entered from (x, y). Diagonal
+        moves may not cut the corner of a blocked cell.
+        """
+        for dx, dy, dist in STRAIGHT:
+            if (cost := self.cost(x + dx, y + dy)) != INF:
+                yield x + dx, y + dy, cost * dist
+        if not diagonal:
+            return
+        for dx, dy, dist in DIAGONAL:
+            if (cost := self.cost(x + dx, y + dy)) == INF:
+                continue
+            if self.walkable(x + dx, y) and self.walkable(x, y + dy):
+                yield x + dx, y + dy, cost * dist
+
+    def heuristic(self, a: tuple[int, int], b: tuple[int, int], diagonal: bool):
+        dx, dy = abs(a[0] - b[0]), abs(a[1] - b[1])
+        if not diagonal:
+            return (dx + dy) * self.min_cost
+        return (max(dx, dy) + (SQRT2 - 1) * min(dx, dy)) * self.min_cost
+
+
+def reconstruct(came_from: dict, node) -> list[tuple[int, int]]:
+    path = [node]
+    while (node := came_from.get(node, None)) is not None:
+        path.append(node)
+    path.reverse()
+    return path
+
+
+def astar(
+    grid: WalkGrid,
+    start: tuple[int, int],
+    goal: tuple[int, int],
+    diagonal: bool = True,
+    max_nodes: int = 20000,
+) -> list[tuple[int, int]] | None:
+    """
+    The cheapest path from start to goal, inclusive, or None if there is none
+    within max_nodes expansions.
+    """
+    if not grid.walkable(*goal) or grid.index(*start) is None:
+        return None
+    if start == goal:
+        return [start]
+    came_from = dict()
+    best = {start: 0.0}
+    counter = 0
+    frontier = [(grid.heuristic(start, goal, diagonal), counter, start)]
+    closed = set()
+    while frontier and len(closed) < max_nodes:
+        _, _, node = heapq.heappop(frontier)
+        if node == goal:
+            return reconstruct(came_from, node)
+        if node in closed:
+            continue
+        closed.add(node)
+        base = best[node]
+        for x, y, cost in grid.moves(*node, diagonal):
+            nxt = (x, y)
+            if (score := base + cost) < best.get(nxt, INF):
+                best[nxt] = score
+                came_from[nxt] = node
+                counter += 1
+                f = score + grid.heuristic(nxt, goal, diagonal)
+                heapq.heappush(frontier, (f, counter, nxt))
+    return None
+
+
+def jps(
+    grid: WalkGrid,
+    start: tuple[int, int],
+    goal: tuple[int, int],
+    max_nodes: int = 20000,
+) -> list[tuple[int, int]] | None:
+    """
+    Jump point search: A* for uniform-cost grids with diagonal moves, which skips
+    over runs of open cells and only expands the points where paths may turn. The
+    result is the same kind of path astar() returns. Diagonal moves may not cut
+    corners.
+    """
+    walkable = grid.walkable
+    if not walkable(*goal) or grid.index(*start) is None:
+        return None
+    if start == goal:
+        return [start]
+    gx, gy = goal
+
+    def jump(x: int, y: int, dx: int, dy: int):
+        while True:
+            if not walkable(x, y):
+                return None
+            if x == gx and y == gy:
+                return x, y
+            if dx and dy:
+                if jump(x + dx, y, dx, 0) or jump(x, y + dy, 0, dy):
+                    return x, y
+                if not (walkable(x + dx, y) and walkable(x, y + dy)):
+                    return None
+            elif dx:
+                if (walkable(x, y - 1) and not walkable(x - dx, y - 1)) or (
+                    walkable(x, y + 1) and not walkable(x - dx, y + 1)
+                ):
+                    return x, y
+            else:
+                if (walkable(x - 1, y) and not walkable(x - 1, y - dy)) or (
+                    walkable(x + 1, y) and not walkable(x + 1, y - dy)
+                ):
+                    return x, y
+            x += dx
+            y += dy
+
+    def directions(node, parent):
+        x, y = node
+        if parent is None:
+            for nx, ny, _ in grid.moves(x, y, True):
+                yield nx - x, ny - y
+            return
+        dx = (x > parent[0]) - (x < parent[0])
+        dy = (y > parent[1]) - (y < parent[1])
+        if dx and dy:
+            if walkable(x, y + dy):
+                yield 0, dy
+            if walkable(x + dx, y):
+                yield dx, 0
+            if walkable(x, y + dy) and walkable(x + dx, y):
+                yield dx, dy
+        elif dx:
+            ahead, up, down = (
+                walkable(x + dx, y),
+                walkable(x, y + 1),
+                walkable(x, y - 1),
+            )
+            if ahead:
+                yield dx, 0
+                if up:
+                    yield dx, 1
+                if down:
+                    yield dx, -1
+            if up:
+                yield 0, 1
+            if down:
+                yield 0, -1
+        else:
+            ahead, right, left = (
+                walkable(x, y + dy),
+                walkable(x + 1, y),
+                walkable(x - 1, y),
+            )
+            if ahead:
+                yield 0, dy
+                if right:
+                    yield 1, dy
+                if left:
+                    yield -1, dy
+            if right:
+                yield 1, 0
+            if left:
+                yield -1, 0
+
+    came_from = dict()
+    best = {start: 0.0}
+    counter = 0
+    frontier = [(grid.heuristic(start, goal, True), counter, start)]
+    closed = set()
+    while frontier and len(closed) < max_nodes:
+        _, _, node = heapq.heappop(frontier)
+        if node == goal:
+            return expand(reconstruct(came_from, node))
+        if node in closed:
+            continue
+        closed.add(node)
+        for dx, dy in directions(node, came_from.get(node, None)):
+            if not (point := jump(node[0] + dx, node[1] + dy, dx, dy)):
+                continue
+            score = best[node] + grid.heuristic(node, point, True)
+            if score < best.get(point, INF):
+                best[point] = score
+                came_from[point] = node
+                counter += 1
+                f = score + grid.heuristic(point, goal, True)
+                heapq.heappush(frontier, (f, counter, point))
+    return None
+
+
+def expand(points: list[tuple[int, int]]) -> list[tuple[int, int]]:
+    """
+    Fill in every cell between consecutive jump points, which lie on straight or
+    diagonal lines.
+    """
+    path = [points[0]]
+    for (x0, y0), (x1, y1) in zip(points, points[1:]):
+        dx = (x1 > x0) - (x1 < x0)
+        dy = (y1 > y0) - (y1 < y0)
+        x, y = x0, y0
+        while (x, y) != (x1, y1):
+            x += dx if x != x1 else 0
+            y += dy if y != y1 else 0
+            path.append((x, y))
+    return path
+
+
+def paths_to(
+    grid: WalkGrid,
+    starts: list[tuple[int, int]],
+    goal: tuple[int, int],
+    diagonal: bool = True,
+    max_nodes: int = 20000,
+) -> dict[tuple[int, int], list[tuple[int, int]] | None]:
+    """
+    Cheapest paths from many starts to one goal, from a single search outward from
+    the goal which stops once every start is reached.
+    """
+    out = {start: None for start in starts}
+    if not grid.walkable(*goal):
+        return out
+    remaining = {start for start in starts if grid.index(*start) is not None}
+    # A start may itself be blocked, as when standing in a doorway, so it can be
+    # stepped back onto even then; the search just doesn't continue past it.
+    start_set = set(remaining)
+    toward = dict()
+    best = {goal: 0.0}
+    counter = 0
+    frontier = [(0.0, counter, goal)]
+    closed = set()
+    moves = STRAIGHT + DIAGONAL if diagonal else STRAIGHT
+    while frontier and remaining and len(closed) < max_nodes:
+        score, _, node = heapq.heappop(frontier)
+        if node in closed:
+            continue
+        closed.add(node)
+        remaining.discard(node)
+        if not grid.walkable(*node) and node != goal:
+            continue
+        # Stepping from a neighbor onto node costs node's cost.
+        x0, y0 = node
+        cost = grid.cost(x0, y0)
+        for dx, dy, dist in moves:
+            nxt = (x0 + dx, y0 + dy)
+            if not grid.walkable(*nxt) and nxt not in start_set:
+                continue
+            if (
+                dx
+                and dy
+                and not (grid.walkable(x0 + dx, y0) and grid.walkable(x0, y0 + dy))
+            ):
+                continue
+            if (new := score + cost * dist) < best.get(nxt, INF):
+                best[nxt] = new
+                toward[nxt] = node
+                counter += 1
+                heapq.heappush(frontier, (new, counter, nxt))
+    for start in starts:
+        if start in closed:
+            path = [start]
+            while path[-1] != goal:
+                path.append(toward[path[-1]])
+            out[start] = path
+    return out
+
+
+class PathRequest:
+    __slots__ = ["grid", "start", "goal", "future"]
+
+    def __init__(self, grid: "Grid", start, goal, future: asyncio.Future):
+        self.grid = grid
+        self.start = start
+        self.goal = goal
+        self.future = future
+
+
+class Pathfinder:
+    """
+    Plans routes over Grids.
+
+    Each Grid's WalkGrid is built once per _rev of its Document, and whole paths are
+    cached until the Grid's walkability changes. find_path() plans immediately.
+    request() queues a plan to be made by the pathfinding game task, which spends at
+    most budget seconds per tick on them and plans requests which share a Grid and
+    goal together with one search.
+    """
+
+    def __init__(
+        self,
+        budget: float = 0.005,
+        max_nodes: int = 20000,
+        cache_size: int = 256,
+        diagonal: bool = True,
+        jump_points: bool = True,
+    ):
+        self.budget = budget
+        self.max_nodes = max_nodes
+        self.cache_size = cache_size
+        self.diagonal = diagonal
+        self.jump_points = jump_points
+        self.walk_grids: dict[str, tuple[str, WalkGrid]] = dict()
+        self.paths: dict[str, OrderedDict] = defaultdict(OrderedDict)
+        self.requests: deque[PathRequest] = deque()
+        self.searches = 0
+        self.cache_hits = 0
+        self.deferred = 0
+
+    def invalidate(self, grid_id: str):
+        """
+        Forget a Grid's walkability and paths, as after its features change.
+        """
+        self.walk_grids.pop(grid_id, None)
+        self.paths.pop(grid_id, None)
+
+    async def walk_grid(self, grid: "Grid") -> WalkGrid:
+        rev = await grid.get_field("_rev")
+        if (found := self.walk_grids.get(grid.id, None)) and found[0] == rev:
+            return found[1]
+        walk_grid = await grid.walkability()
+        self.walk_grids[grid.id] = (rev, walk_grid)
+        self.paths.pop(grid.id, None)
+        return walk_grid
+
+    def search(self, walk_grid: WalkGrid, start, goal):
+        self.searches += 1
+        if self.jump_points and self.diagonal and walk_grid.uniform:
+            return jps(walk_grid, start, goal, max_nodes=self.max_nodes)
+        return astar(
+            walk_grid, start, goal, diagonal=self.diagonal, max_nodes=self.max_nodes
+        )
+
+    def cached(self, grid_id: str, start, goal):
+        paths = self.paths.get(grid_id, None)
+        if paths is None or (start, goal) not in paths:
+            return False, None
+        paths.move_to_end((start, goal))
+        self.cache_hits += 1
+        return True, paths[(start, goal)]
+
+    def remember(self, grid_id: str, start, goal, path):
+        paths = self.paths[grid_id]
+        paths[(start, goal)] = path
+        while len(paths) > self.cache_size:
+            paths.popitem(last=False)
+
+    async def find_path(
+        self, grid: "Grid", start: tuple[int, int], goal: tuple[int, int]
+    ) -> list[tuple[int, int]] | None:
+        """
+        The path from start to goal, inclusive, or None if there isn't one.
+        """
+        start, goal = tuple(start), tuple(goal)
+        walk_grid = await self.walk_grid(grid)
+        found, path = self.cached(grid.id, start, goal)
+        if not found:
+            path = self.search(walk_grid, start, goal)
+            self.remember(grid.id, start, goal, path)
+        return path
+
+    def request(
+        self, grid: "Grid", start: tuple[int, int], goal: tuple[int, int]
+    ) -> asyncio.Future:
+        """
+        Queue a path to be found within a later tick's budget. The returned Future
+        resolves to what find_path() would return.
+
+        Don't await it from within a game task, such as a command run by
+        simulation_commands: the tick can't end until that task does, so a request
+        left for a later tick would never be resolved. Use find_path() there, or
+        add a done callback.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self.requests.append(PathRequest(grid, tuple(start), tuple(goal), future))
+        return future
+
+    async def run(self):
+        """
+        Plan queued requests, oldest first, until the budget is spent. Whatever is
+        left waits for the next tick.
+        """
+        deadline = time.perf_counter() + self.budget
+        while self.requests and time.perf_counter() < deadline:
+            first = self.requests.popleft()
+            batch = [first]
+            # Take every other queued request with the same Grid and goal.
+            rest = deque()
+            for req in self.requests:
+                if req.grid.id == first.grid.id and req.goal == first.goal:
+                    batch.append(req)
+                else:
+                    rest.append(req)
+            self.requests = rest
+            try:
+                await self.plan(batch)
+            except Exception as err:
+                for req in batch:
+                    if not req.future.done():
+                        req.future.set_exception(err)
+        self.deferred += len(self.requests)
+
+    async def plan(self, batch: list[PathRequest]):
+        grid, goal = batch[0].grid, batch[0].goal
+        walk_grid = await self.walk_grid(grid)
+        pending = dict()
+        for req in batch:
+            found, path = self.cached(grid.id, req.start, goal)
+            if found:
+                if not req.future.done():
+                    req.future.set_result(path)
+            else:
+                pending.setdefault(req.start, list()).append(req)
+        if not pending:
+            return
+        if len(pending) == 1:
+            start = next(iter(pending))
+            results = {start: self.search(walk_grid, start, goal)}
+        else:
+            self.searches += 1
+            results = paths_to(
+                walk_grid,
+                list(pending),
+                goal,
+                diagonal=self.diagonal,
+                max_nodes=self.max_nodes,
+            )
+        for start, reqs in pending.items():
+            path = results[start]
+            self.remember(grid.id, start, goal, path)
+            for req in reqs:
+                if not req.future.done():
+                    req.future.set_result(path)
+
+    def stats(self) -> dict:
+        return {
+            "queued": len(self.requests),
+            "searches": self.searches,
+            "cache_hits": self.cache_hits,
+            "deferred": self.deferred,
+            "grids": len(self.walk_grids),
+        }
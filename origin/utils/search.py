@@ -1,5 +1,6 @@
 import origin
 from enum import IntEnum
+from origin.db.objects import get_appearances
 
 
 class SearchType(IntEnum):
@@ -10,6 +11,9 @@ class SearchType(IntEnum):
 
 
 class Searcher:
+    # How many candidate documents to retrieve per database round trip.
+    batch_size = 100
+
     def __init__(
         self,
         caller,
@@ -43,6 +47,13 @@ class Searcher:
         # return an ObjectAppearance instead of an Object wrapper.
         self.return_appearance = return_appearance
 
+        # The keyword prefix being searched for, if candidates may be narrowed down
+        # by it before their appearances are built, the ID being searched for, and
+        # how many results are wanted (None for all). Set by search().
+        self.keyword = None
+        self.target_id = None
+        self.limit = None
+
     def add_inventory(self, obj):
         self.targets.append((SearchType.Inventory, obj))
         return self
@@ -65,26 +76,77 @@ class Searcher:
         return self
 
     async def _search_world(self):
+        """
+        Yields pages of the IDs of world search candidates. Keyword matching,
+        excluding the caller, and the page size are all handled by the database.
+        """
+        if self.target_id:
+            if self.target_id != self.caller.id:
+                yield [self.target_id]
+            return
         objects = origin.DB.managers["object"]
-        async for obj in objects.all_proxy():
-            if obj == self.caller:
-                continue
-            yield obj
-
-    def _search_helper(self, search_type: SearchType, obj: "Object"):
+        page_size = self.batch_size
+        if self.limit:
+            page_size = min(page_size, self.limit)
+        after = None
+        while True:
+            ids, after = await objects.search_keyword_ids(
+                self.keyword or "",
+                exclude=self.caller.id,
+                count=page_size,
+                after=after,
+            )
+            if ids:
+                yield ids
+            if after is None:
+                break
+            page_size = self.batch_size
+
+    async def _search_helper(self, search_type: SearchType, obj: "Object"):
         """
-        This should explicitly return an async generator that yields, like
-        _search_world just above it.
+        Returns the IDs of the candidates for a search target other than the world.
         """
+        if self.keyword:
+            match search_type:
+                case SearchType.Inventory:
+                    return await obj.search_contents_ids(
+                        "inventory_location", self.keyword
+                    )
+                case SearchType.Equipment:
+                    return await obj.search_contents_ids(
+                        "equipment_location", self.keyword
+                    )
+                case SearchType.Location:
+                    return await obj.search_neighbor_ids(self.keyword)
         match search_type:
             case SearchType.Inventory:
-                return obj.inventory()
+                return await obj.inventory_ids()
             case SearchType.Equipment:
-                return obj.equipment()
+                return await obj.equipment_ids()
             case SearchType.Location:
-                return obj.neighbors()
-            case SearchType.World:
-                return self._search_world()
+                return await obj.neighbor_ids()
+
+    async def _search_pages(self, search_type: SearchType, obj: "Object"):
+        if search_type == SearchType.World:
+            async for page in self._search_world():
+                yield page
+            return
+        ids = await self._search_helper(search_type, obj)
+        for i in range(0, len(ids), self.batch_size):
+            yield ids[i : i + self.batch_size]
+
+    async def _search_batched(self, search_type: SearchType, obj: "Object"):
+        """
+        Yields (Object, ObjectAppearance) pairs for the candidates of a search
+        target. Documents are retrieved, and appearances built, a page at a time, so a
+        search which is satisfied early stops fetching.
+        """
+        async for page in self._search_pages(search_type, obj):
+            docs = await origin.DB.getDocuments(page, proxy=False)
+            pairs = [(await origin.DB.getProxy(doc), doc) for doc in docs]
+            appearances = await get_appearances(self.caller, pairs)
+            for (found, doc), appearance in zip(pairs, appearances):
+                yield found, appearance
 
     async def search(self) -> list["Object"]:
         counter = 0
@@ -117,6 +179,16 @@ class Searcher:
 
         found = []
 
+        # Wildcards and IDs can't be found through keyword indexes.
+        self.keyword = None
+        self.target_id = None
+        if self.allow_id and "/" in target:
+            self.target_id = target
+        elif target != "*":
+            self.keyword = tlower
+        # Only a numeric prefix bounds how many candidates are needed.
+        self.limit = prefix if isinstance(prefix, int) else None
+
         if self.allow_self and (target in ("self", "me")):
             if self.return_appearance:
                 appearance = await self.caller.get_appearance(self.caller)
@@ -126,8 +198,7 @@ class Searcher:
             return found
 
         for search_type, loc in self.targets:
-            async for obj in self._search_helper(search_type, loc):
-                appearance = await obj.get_appearance(self.caller)
+            async for obj, appearance in self._search_batched(search_type, loc):
                 added = True if target == "*" else False
 
                 if not added and self.allow_id:
@@ -0,0 +1,213 @@
+import base64
+import zlib
+
+import origin
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class TileLayer:
+    """
+    A dense rectangle of tiles, for Grids where nearly every cell matters.
+
+    Tiles are a uint16 array, indexed [y, x] relative to (min_x, min_y), of positions
+    in palette, a list of names from origin.TILES. Walkability, movement cost and
+    opacity are looked up per palette entry into parallel arrays, so viewports,
+    field of view and minimaps are array operations rather than loops over cells.
+    Cells outside the rectangle are default.
+
+    Requires NumPy, which is an optional dependency.
+    """
+
+    def __init__(
+        self,
+        min_x: int,
+        min_y: int,
+        tiles: "np.ndarray",
+        palette: list[str],
+        default: int = 0,
+    ):
+        if np is None:
+            raise RuntimeError("Tile layers require NumPy. Try: pip install numpy")
+        self.min_x = min_x
+        self.min_y = min_y
+        self.tiles = np.ascontiguousarray(tiles, dtype=np.uint16)
+        self.height, self.width = self.tiles.shape
+        self.palette = list(palette)
+        self.default = default
+        self.refresh()
+
+    @classmethod
+    def blank(
+        cls, min_x: int, min_y: int, max_x: int, max_y: int, default_tile: str
+    ) -> "TileLayer":
+        """
+        A layer covering min_x..max_x and min_y..max_y inclusive, all default_tile.
+        """
+        shape = (max_y - min_y + 1, max_x - min_x + 1)
+        return cls(min_x, min_y, np.zeros(shape, dtype=np.uint16), [default_tile])
+
+    def refresh(self):
+        """
+        Rebuild the per-tile arrays, as after the palette or origin.TILES change.
+        """
+        tiles = [origin.TILES.get(name, None) for name in self.palette]
+        self.walkable_lut = np.array(
+            [bool(getattr(t, "walkable", False)) for t in tiles], dtype=bool
+        )
+        self.cost_lut = np.array(
+            [float(getattr(t, "cost", 1.0)) for t in tiles], dtype=np.float32
+        )
+        self.opaque_lut = np.array(
+            [bool(getattr(t, "opaque", False)) for t in tiles], dtype=bool
+        )
+        self.symbol_lut = np.frombuffer(
+            "".join((getattr(t, "symbol", None) or "?")[:1] for t in tiles).encode(
+                "ascii", "replace"
+            ),
+            dtype=np.uint8,
+        )
+        self.walkable = self.walkable_lut[self.tiles]
+        self.cost = self.cost_lut[self.tiles]
+
+    @property
+    def max_x(self) -> int:
+        return self.min_x + self.width - 1
+
+    @property
+    def max_y(self) -> int:
+        return self.min_y + self.height - 1
+
+    def tile_id(self, name: str) -> int:
+        try:
+            return self.palette.index(name)
+        except ValueError:
+            self.palette.append(name)
+            self.refresh()
+            return len(self.palette) - 1
+
+    def contains(self, x: int, y: int) -> bool:
+        return 0 <= x - self.min_x < self.width and 0 <= y - self.min_y < self.height
+
+    def get(self, x: int, y: int) -> str:
+        if not self.contains(x, y):
+            return self.palette[self.default]
+        return self.palette[self.tiles[y - self.min_y, x - self.min_x]]
+
+    def set(self, x: int, y: int, name: str):
+        if not self.contains(x, y):
+            raise ValueError(f"({x}, {y}) is outside this tile layer.")
+        tile = self.tile_id(name)
+        ly, lx = y - self.min_y, x - self.min_x
+        self.tiles[ly, lx] = tile
+        self.walkable[ly, lx] = self.walkable_lut[tile]
+        self.cost[ly, lx] = self.cost_lut[tile]
+
+    def tiles_at(self, xs, ys) -> "np.ndarray":
+        """
+        Tile IDs at arrays of absolute coordinates, which may fall outside the layer.
+        Per-tile properties follow by indexing a lut with the result.
+        """
+        xs = np.asarray(xs) - self.min_x
+        ys = np.asarray(ys) - self.min_y
+        inside = (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height)
+        out = np.full(xs.shape, self.default, dtype=np.uint16)
+        out[inside] = self.tiles[ys[inside], xs[inside]]
+        return out
+
+    def viewport(self, min_x: int, min_y: int, max_x: int, max_y: int) -> "np.ndarray":
+        """
+        Tile IDs for min_x <= x < max_x and min_y <= y < max_y, indexed [y, x].
+        A view into the layer when the area lies wholly inside it.
+        """
+        lx0, ly0 = min_x - self.min_x, min_y - self.min_y
+        lx1, ly1 = max_x - self.min_x, max_y - self.min_y
+        if 0 <= lx0 and 0 <= ly0 and lx1 <= self.width and ly1 <= self.height:
+            return self.tiles[ly0:ly1, lx0:lx1]
+        ys, xs = np.mgrid[min_y:max_y, min_x:max_x]
+        return self.tiles_at(xs, ys)
+
+    def features(
+        self, min_x: int, min_y: int, max_x: int, max_y: int
+    ) -> list[tuple[tuple[int, int], dict]]:
+        """
+        The area's non-default tiles, as get_surroundings' (coordinates, data) pairs.
+        """
+        view = self.viewport(min_x, min_y, max_x, max_y)
+        ys, xs = np.nonzero(view != self.default)
+        palette = self.palette
+        return [
+            ((min_x + int(x), min_y + int(y)), {"tile": palette[view[y, x]]})
+            for y, x in zip(ys.tolist(), xs.tolist())
+        ]
+
+    def render(self, tiles: "np.ndarray", mask: "np.ndarray" = None) -> list[str]:
+        """
+        Render tile IDs, indexed [y, x], as rows of symbols, highest y first. Cells
+        where mask is False are blank.
+        """
+        symbols = self.symbol_lut[tiles]
+        if mask is not None:
+            symbols = np.where(mask, symbols, ord(" ")).astype(np.uint8)
+        symbols = np.ascontiguousarray(symbols[::-1])
+        width = symbols.shape[1]
+        data = symbols.tobytes().decode("ascii")
+        return [data[i : i + width] for i in range(0, len(data), width)]
+
+    def fov(self, x: int, y: int, radius: int) -> "np.ndarray":
+        """
+        Which cells within radius of (x, y) can be seen from it, as a boolean array
+        indexed [y, x] over x - radius..x + radius and y - radius..y + radius.
+
+        Each cell is visible unless an opaque tile lies on the straight line to it,
+        found by sampling every line at once. Opaque cells themselves are visible.
+        """
+        dy, dx = np.mgrid[-radius : radius + 1, -radius : radius + 1]
+        in_radius = dx * dx + dy * dy <= radius * radius
+        if radius < 2:
+            return in_radius
+        steps = np.arange(1, 2 * radius) / (2 * radius)
+        px = np.rint(dx[None] * steps[:, None, None]).astype(np.int64)
+        py = np.rint(dy[None] * steps[:, None, None]).astype(np.int64)
+        opaque = self.opaque_lut[self.tiles_at(x + px, y + py)]
+        # The viewer's own cell and the target cell never block.
+        ends = ((px == 0) & (py == 0)) | ((px == dx[None]) & (py == dy[None]))
+        blocked = (opaque & ~ends).any(axis=0)
+        return in_radius & ~blocked
+
+    def minimap(
+        self, min_x: int, min_y: int, max_x: int, max_y: int, scale: int
+    ) -> list[str]:
+        """
+        Render an area at one symbol per scale x scale block, using each block's
+        lowest-left tile.
+        """
+        view = self.viewport(min_x, min_y, max_x, max_y)
+        return self.render(view[::scale, ::scale])
+
+    def encode(self) -> dict:
+        data = zlib.compress(self.tiles.astype("<u2").tobytes())
+        return {
+            "min_x": self.min_x,
+            "min_y": self.min_y,
+            "width": self.width,
+            "height": self.height,
+            "palette": self.palette,
+            "default": self.default,
+            "data": base64.b64encode(data).decode("ascii"),
+        }
+
+    @classmethod
+    def decode(cls, data: dict) -> "TileLayer":
+        raw = zlib.decompress(base64.b64decode(data["data"]))
+        tiles = np.frombuffer(raw, dtype="<u2").reshape(data["height"], data["width"])
+        return cls(
+            data["min_x"],
+            data["min_y"],
+            tiles.copy(),
+            data["palette"],
+            data.get("default", 0),
+        )